@@ -0,0 +1,118 @@
+"""Structured logging that formats and writes records off the event loop thread.
+
+Loggers hand records to a QueueHandler; a QueueListener thread formats them
+and writes to stdout, so a slow log collector never blocks the event loop.
+Use %-style arguments (logger.info("x=%s", x)) so nothing is formatted for
+disabled levels. Session ids and event types travel as record fields:
+
+    log = session_logger(logger, session_id)
+    log.info("Tool started", extra={"event_type": "toolUse", "tool": name})
+"""
+import datetime
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+
+# DEBUG, INFO, WARNING, ERROR
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+# "text" for humans, "json" for log collectors
+LOG_FORMAT = os.environ.get('LOG_FORMAT', 'text').lower()
+
+ROOT_LOGGER = "nova_sonic"
+
+# Attributes every LogRecord has; anything else was passed through extra=
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "taskName"}
+
+_listener = None
+
+
+def _extra_fields(record):
+    return {key: value for key, value in vars(record).items() if key not in _RECORD_ATTRIBUTES}
+
+
+class TextFormatter(logging.Formatter):
+    """One line per record: time, level, logger, caller, then key=value fields"""
+
+    def format(self, record):
+        message = record.getMessage()
+        timestamp = datetime.datetime.fromtimestamp(record.created).strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
+        line = f"{timestamp} {record.levelname} {record.name} {record.funcName} {message}"
+        fields = _extra_fields(record)
+        if fields:
+            line += " " + " ".join(f"{key}={value}" for key, value in fields.items())
+        if record.exc_info:
+            line += "\n" + self.formatException(record.exc_info)
+        return line
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record, with extra fields at the top level"""
+
+    def format(self, record):
+        entry = {
+            "timestamp": datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "caller": f"{record.module}.{record.funcName}:{record.lineno}",
+            "message": record.getMessage()
+        }
+        entry.update(_extra_fields(record))
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that leaves all formatting to the listener thread"""
+
+    def prepare(self, record):
+        return record
+
+
+class SessionLogger(logging.LoggerAdapter):
+    """Adds a session_id field to every record, merged with per-call extra fields"""
+
+    def process(self, msg, kwargs):
+        extra = kwargs.get("extra")
+        kwargs["extra"] = {**self.extra, **extra} if extra else self.extra
+        return msg, kwargs
+
+
+def get_logger(name):
+    """Return the application logger for a module."""
+    return logging.getLogger(f"{ROOT_LOGGER}.{name}")
+
+
+def session_logger(logger, session_id, **fields):
+    """Wrap a logger so every record carries the session id and any extra fields."""
+    return SessionLogger(logger, {"session_id": session_id, **fields})
+
+
+def setup_logging(level=LOG_LEVEL, fmt=LOG_FORMAT, stream=None):
+    """Route application logs through a background writer thread. Safe to call more than once."""
+    global _listener
+    logger = logging.getLogger(ROOT_LOGGER)
+    logger.setLevel(level)
+    if _listener is not None:
+        return logger
+
+    handler = logging.StreamHandler(stream or sys.stdout)
+    handler.setFormatter(JsonFormatter() if fmt == "json" else TextFormatter())
+    log_queue = queue.SimpleQueue()
+    _listener = logging.handlers.QueueListener(log_queue, handler, respect_handler_level=True)
+    _listener.start()
+
+    logger.addHandler(_DeferredQueueHandler(log_queue))
+    logger.propagate = False
+    return logger
+
+
+def shutdown_logging():
+    """Flush queued records and stop the writer thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -0,0 +1,224 @@
+"""Helpers for moving PCM audio between WebSocket clients and Bedrock."""
+import asyncio
+import base64
+import json
+import struct
+import time
+from collections import deque
+from metrics import AUDIO_INPUT_DROPPED_FRAMES
+
+# Microphone audio sent to Bedrock: 16 kHz, 16-bit mono PCM
+INPUT_SAMPLE_RATE = 16000
+INPUT_BYTES_PER_MS = INPUT_SAMPLE_RATE * 2 // 1000
+
+# Sample rate of the audio Nova Sonic sends back to the client
+OUTPUT_SAMPLE_RATE = 24000
+
+# Binary frames sent to the client are a small header followed by raw
+# 16-bit little-endian mono PCM. Header layout (little-endian):
+#   frame type (u8) | header version (u8) | sample rate in Hz (u16) | sequence (u32)
+AUDIO_FRAME_HEADER = struct.Struct('<BBHI')
+AUDIO_FRAME_TYPE_PCM = 0x01
+AUDIO_FRAME_VERSION = 1
+
+
+def pack_audio_frame(pcm_bytes, sequence, sample_rate=OUTPUT_SAMPLE_RATE):
+    """Prefix raw PCM with the binary frame header."""
+    header = AUDIO_FRAME_HEADER.pack(
+        AUDIO_FRAME_TYPE_PCM,
+        AUDIO_FRAME_VERSION,
+        sample_rate,
+        sequence & 0xFFFFFFFF
+    )
+    return header + pcm_bytes
+
+
+# Standard base64 alphabet (padding is checked separately)
+BASE64_ALPHABET = b'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/'
+
+
+def is_valid_base64(content):
+    """Cheaply check that a client payload is well-formed base64 without decoding it."""
+    if not isinstance(content, str) or not content or len(content) % 4 or not content.isascii():
+        return False
+    data = content.rstrip('=')
+    if len(content) - len(data) > 2:
+        return False
+    # bytes.translate with a delete table leaves only characters outside the alphabet
+    return not data.encode('ascii').translate(None, BASE64_ALPHABET)
+
+
+class AudioEventEncoder:
+    """Build compact audioInput events for one audio content block.
+
+    The JSON around the content is fixed for a session, so it is encoded once
+    and every event is just prefix + base64 bytes + suffix.
+    """
+
+    def __init__(self, prompt_name, content_name):
+        self.prefix = (
+            '{"event":{"audioInput":{"promptName":' + json.dumps(prompt_name)
+            + ',"contentName":' + json.dumps(content_name) + ',"content":"'
+        ).encode('utf-8')
+        self.suffix = b'"}}}'
+
+    def encode(self, audio_base64):
+        """Return the event bytes for content that is already base64 (str or bytes)."""
+        if isinstance(audio_base64, str):
+            audio_base64 = audio_base64.encode('ascii')
+        return b''.join((self.prefix, audio_base64, self.suffix))
+
+    def encode_pcm(self, pcm_bytes):
+        """Return the event bytes for raw PCM."""
+        return b''.join((self.prefix, base64.b64encode(pcm_bytes), self.suffix))
+
+
+class AudioCoalescer:
+    """Accumulate small PCM chunks into frames of a target duration.
+
+    Chunks at least as large as the target are passed through untouched when
+    nothing is buffered. Buffered audio is flushed once the target size is
+    reached or, via time_until_flush()/flush(), when the oldest buffered
+    chunk has waited max_delay_ms. A target of 0 disables coalescing.
+    """
+
+    def __init__(self, target_ms=64, max_delay_ms=100, bytes_per_ms=INPUT_BYTES_PER_MS):
+        self.target_bytes = target_ms * bytes_per_ms
+        self.max_delay = max_delay_ms / 1000
+        self._buffer = bytearray()
+        self._first_chunk_time = None
+
+    @property
+    def pending(self):
+        """Number of buffered bytes not yet emitted."""
+        return len(self._buffer)
+
+    def add(self, pcm_bytes, now=None):
+        """Add a chunk and return a frame once the target size is reached, else None."""
+        if not self._buffer:
+            if len(pcm_bytes) >= self.target_bytes:
+                return pcm_bytes
+            self._first_chunk_time = time.monotonic() if now is None else now
+        self._buffer += pcm_bytes
+        if len(self._buffer) >= self.target_bytes:
+            return self.flush()
+        return None
+
+    def time_until_flush(self, now=None):
+        """Seconds until buffered audio must be flushed, or None if nothing is buffered."""
+        if not self._buffer:
+            return None
+        now = time.monotonic() if now is None else now
+        return max(0.0, self._first_chunk_time + self.max_delay - now)
+
+    def flush(self):
+        """Return all buffered audio as one frame, or None if the buffer is empty."""
+        if not self._buffer:
+            return None
+        frame = bytes(self._buffer)
+        self._buffer.clear()
+        self._first_chunk_time = None
+        return frame
+
+
+class AudioBackpressureError(Exception):
+    """Raised when the ingest queue is full and its policy is to close the session."""
+
+
+class AudioIngestQueue:
+    """Bounded queue for microphone audio waiting to be sent to Bedrock.
+
+    The queue is full when it holds maxsize frames or, if max_ms is set,
+    when a new frame would take the queued audio past max_ms. The policy
+    decides what happens to a new frame then: "block" makes the producer
+    wait, "drop_oldest" discards the oldest queued frames to make room and
+    "close" raises AudioBackpressureError. Once close() is called, blocked
+    and new producers get AudioBackpressureError as well.
+    """
+
+    POLICIES = ("block", "drop_oldest", "close")
+
+    def __init__(self, maxsize=32, policy="drop_oldest", max_ms=0):
+        if policy not in self.POLICIES:
+            raise ValueError(f"Unknown audio queue policy: {policy}")
+        self.maxsize = maxsize
+        self.policy = policy
+        self.max_ms = max_ms
+        self.queued_ms = 0
+        self.dropped_frames = 0
+        self.dropped_ms = 0
+        self.high_water_mark = 0
+        self.high_water_ms = 0
+        # (duration_ms, frame) pairs, oldest first
+        self._frames = deque()
+        self._not_empty = asyncio.Event()
+        self._not_full = asyncio.Event()
+        self.closed = False
+
+    def _full(self, duration_ms):
+        if len(self._frames) >= self.maxsize:
+            return True
+        return self.max_ms > 0 and bool(self._frames) and self.queued_ms + duration_ms > self.max_ms
+
+    def _pop(self):
+        duration_ms, item = self._frames.popleft()
+        self.queued_ms -= duration_ms
+        self._not_full.set()
+        return duration_ms, item
+
+    async def put(self, item, duration_ms=0):
+        """Queue a frame of duration_ms audio, applying the overflow policy if the queue is full."""
+        if self.closed:
+            raise AudioBackpressureError("Audio ingest queue closed")
+        while self._full(duration_ms):
+            if self.policy == "drop_oldest":
+                dropped_ms, _ = self._pop()
+                self.dropped_frames += 1
+                self.dropped_ms += dropped_ms
+                AUDIO_INPUT_DROPPED_FRAMES.inc()
+            elif self.policy == "close":
+                raise AudioBackpressureError(
+                    f"Audio ingest queue full ({len(self._frames)} frames, {self.queued_ms:.0f} ms)"
+                )
+            else:
+                self._not_full.clear()
+                await self._not_full.wait()
+                if self.closed:
+                    raise AudioBackpressureError("Audio ingest queue closed")
+        self._frames.append((duration_ms, item))
+        self.queued_ms += duration_ms
+        self._not_empty.set()
+        if len(self._frames) > self.high_water_mark:
+            self.high_water_mark = len(self._frames)
+        if self.queued_ms > self.high_water_ms:
+            self.high_water_ms = self.queued_ms
+
+    async def get(self):
+        """Wait for and return the next queued frame."""
+        while not self._frames:
+            self._not_empty.clear()
+            await self._not_empty.wait()
+        return self._pop()[1]
+
+    def close(self):
+        """Stop accepting audio (the consumer is gone) and wake any blocked producer."""
+        self.closed = True
+        self._not_full.set()
+
+    def qsize(self):
+        """Number of frames currently queued."""
+        return len(self._frames)
+
+    def stats(self):
+        """Return queue counters for monitoring."""
+        return {
+            "policy": self.policy,
+            "maxsize": self.maxsize,
+            "max_ms": self.max_ms,
+            "depth": len(self._frames),
+            "queued_ms": self.queued_ms,
+            "high_water_mark": self.high_water_mark,
+            "high_water_ms": self.high_water_ms,
+            "dropped_frames": self.dropped_frames,
+            "dropped_ms": self.dropped_ms
+        }
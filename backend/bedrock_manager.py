@@ -1,135 +1,247 @@
 import asyncio
 import base64
 import json
+import logging
 import uuid
 import warnings
-import pytz
 import random
 import hashlib
-import datetime
 import time
-import inspect
 import os
+import threading
 import boto3
-from botocore.exceptions import ClientError
 from aws_sdk_bedrock_runtime.client import BedrockRuntimeClient, InvokeModelWithBidirectionalStreamOperationInput
 from aws_sdk_bedrock_runtime.models import InvokeModelWithBidirectionalStreamInputChunk, BidirectionalInputPayloadPart
 from aws_sdk_bedrock_runtime.config import Config
 from smithy_aws_core.identity.environment import EnvironmentCredentialsResolver
+from audio_pipeline import INPUT_BYTES_PER_MS, AudioCoalescer, AudioEventEncoder, AudioIngestQueue, pack_audio_frame
+from client_sender import PRIORITY_TEXT
+from app_logging import get_logger, session_logger
+from metrics import BEDROCK_EVENTS_RECEIVED, BEDROCK_EVENTS_SENT, RESPONSE_LATENCY_SECONDS, TOOL_LATENCY_SECONDS
+from persistence import DynamoWriteBehind
+from patient_store import PATIENT_DATA_PATH, PatientStore
+from lookup_cache import IdempotencyCache, TTLCache
+from tool_backends import BackendUnavailableError, create_tool_backends
+from prompt_registry import prompt_registry
+import output_events
 
 # Suppress warnings
 warnings.filterwarnings("ignore")
 
-# Debug mode flag
-DEBUG = False
+# Microphone audio is coalesced into frames of this duration before it is sent
+# to Bedrock; buffered audio is never held longer than the max delay
+AUDIO_COALESCE_MS = int(os.environ.get('AUDIO_COALESCE_MS', '64'))
+AUDIO_COALESCE_MAX_DELAY_MS = int(os.environ.get('AUDIO_COALESCE_MAX_DELAY_MS', '100'))
 
-def debug_print(message):
-    """Print only if debug mode is enabled"""
-    if DEBUG:
-        functionName = inspect.stack()[1].function
-        if functionName == 'time_it' or functionName == 'time_it_async':
-            functionName = inspect.stack()[2].function
-        print('{:%Y-%m-%d %H:%M:%S.%f}'.format(datetime.datetime.now())[:-3] + ' ' + functionName + ' ' + message)
+# Per-session cap on queued microphone audio, in frames and in milliseconds of
+# audio (0 disables the duration cap), and what to do when it is reached
+# ("block", "drop_oldest" or "close")
+AUDIO_INPUT_QUEUE_MAX = int(os.environ.get('AUDIO_INPUT_QUEUE_MAX', '32'))
+AUDIO_INPUT_QUEUE_MAX_MS = int(os.environ.get('AUDIO_INPUT_QUEUE_MAX_MS', '2000'))
+AUDIO_INPUT_QUEUE_POLICY = os.environ.get('AUDIO_INPUT_QUEUE_POLICY', 'drop_oldest')
+
+# Bidirectional streams multiplexed over one shared client connection before
+# the registry opens another one
+BEDROCK_MAX_STREAMS_PER_CONNECTION = int(os.environ.get('BEDROCK_MAX_STREAMS_PER_CONNECTION', '50'))
+# "aws" for Bedrock, "fake" for the in-process stand-in used in load tests (see fake_bedrock.py)
+BEDROCK_BACKEND = os.environ.get('BEDROCK_BACKEND', 'aws')
+
+# Clinic lookups are cached per DNI; unknown DNIs are cached for a shorter time
+CLINIC_CACHE_MAX = int(os.environ.get('CLINIC_CACHE_MAX', '10000'))
+CLINIC_CACHE_TTL_S = float(os.environ.get('CLINIC_CACHE_TTL_S', '300'))
+CLINIC_CACHE_NEGATIVE_TTL_S = float(os.environ.get('CLINIC_CACHE_NEGATIVE_TTL_S', '30'))
+
+# Idempotent tools started as soon as their toolUse event arrives instead of
+# waiting for the TOOL contentEnd (comma-separated, empty disables eager mode)
+EAGER_TOOLS = {name.strip().lower() for name in os.environ.get('EAGER_TOOLS', 'getInfoFromClinic').split(',') if name.strip()}
+
+# Repeated registerUser/callAmbulance calls within this window reuse the first result
+TOOL_IDEMPOTENCY_WINDOW_S = float(os.environ.get('TOOL_IDEMPOTENCY_WINDOW_S', '120'))
+
+logger = get_logger("bedrock")
 
 def time_it(label, methodToRun):
     start_time = time.perf_counter()
     result = methodToRun()
     end_time = time.perf_counter()
-    debug_print(f"Execution time for {label}: {end_time - start_time:.4f} seconds")
+    logger.debug("Execution time for %s: %.4f seconds", label, end_time - start_time, stacklevel=2)
     return result
 
 async def time_it_async(label, methodToRun):
     start_time = time.perf_counter()
     result = await methodToRun()
     end_time = time.perf_counter()
-    debug_print(f"Execution time for {label}: {end_time - start_time:.4f} seconds")
+    logger.debug("Execution time for %s: %.4f seconds", label, end_time - start_time, stacklevel=2)
     return result
 
-def save_to_dynamodb(table, user_data):
-    """Save user data to DynamoDB table"""
-    try:
-        # Prepare item for DynamoDB
-        item = {
-            'dni': user_data['dni'],
-            'nombre': user_data['nombre'],
-            'apellido': user_data['apellido'],
-            'nombre_completo': f"{user_data['nombre']} {user_data['apellido']}",
-            'edad': user_data['edad'],
-            'talla': user_data['talla'],
-            'peso': user_data['peso'],
-            'enfermedades': user_data.get('enfermedades', []),
-            'historial_clinico': user_data.get('historial_clinico', []),
-            'rol_familiar': user_data.get('rol_familiar', 'Titular'),
-            'gestores_autorizados': user_data.get('gestores_autorizados', []),
-            'pacientes_a_cargo': user_data.get('pacientes_a_cargo', []),
-            'solicitudes_pendientes': user_data.get('solicitudes_pendientes', []),
-            'timestamp': datetime.datetime.now(pytz.UTC).isoformat(),
-            'ultima_actualizacion': datetime.datetime.now(pytz.UTC).isoformat()
+class BedrockClientRegistry:
+    """Process-wide Bedrock clients shared across sessions, keyed by region and endpoint"""
+    
+    def __init__(self, max_streams_per_connection=BEDROCK_MAX_STREAMS_PER_CONNECTION):
+        self.max_streams_per_connection = max_streams_per_connection
+        # One resolver for the whole process so credentials are resolved once and cached
+        self.credentials_resolver = None
+        # (region, endpoint) -> list of [client, active_streams]
+        self.clients = {}
+    
+    def _create_client(self, region, endpoint_uri):
+        if BEDROCK_BACKEND == 'fake':
+            # Load-test stand-in, only imported when selected
+            from fake_bedrock import FakeBedrockClient
+            logger.debug("Creating fake Bedrock client for %s", region)
+            return FakeBedrockClient()
+        if self.credentials_resolver is None:
+            self.credentials_resolver = EnvironmentCredentialsResolver()
+        config = Config(
+            endpoint_uri=endpoint_uri,
+            region=region,
+            aws_credentials_identity_resolver=self.credentials_resolver,
+        )
+        logger.debug("Creating Bedrock client for %s (%s)", region, endpoint_uri)
+        return BedrockRuntimeClient(config=config)
+    
+    def acquire(self, region, endpoint_uri=None):
+        """Return a shared client with spare stream capacity, creating one if needed."""
+        endpoint_uri = endpoint_uri or f"https://bedrock-runtime.{region}.amazonaws.com"
+        entries = self.clients.setdefault((region, endpoint_uri), [])
+        for entry in entries:
+            if entry[1] < self.max_streams_per_connection:
+                entry[1] += 1
+                return entry[0]
+        client = self._create_client(region, endpoint_uri)
+        entries.append([client, 1])
+        return client
+    
+    def release(self, client):
+        """Give back the stream slot taken by acquire()."""
+        for entries in self.clients.values():
+            for entry in entries:
+                if entry[0] is client:
+                    entry[1] = max(0, entry[1] - 1)
+                    return
+    
+    def stats(self):
+        """Return the number of clients and active streams per region/endpoint."""
+        return {
+            f"{region} {endpoint_uri}": {
+                "clients": len(entries),
+                "active_streams": sum(entry[1] for entry in entries)
+            }
+            for (region, endpoint_uri), entries in self.clients.items()
         }
-        
-        # Only add poliza fields if they have non-empty values
-        # DynamoDB doesn't allow empty strings in GSI key attributes
-        poliza_numero = user_data.get('poliza', {}).get('numero', '')
-        if poliza_numero:
-            item['poliza_numero'] = poliza_numero
-        
-        poliza_tipo = user_data.get('poliza', {}).get('tipo', '')
-        if poliza_tipo:
-            item['poliza_tipo'] = poliza_tipo
-            
-        poliza_estado = user_data.get('poliza', {}).get('estado', '')
-        if poliza_estado:
-            item['poliza_estado'] = poliza_estado
-            
-        poliza_cobertura = user_data.get('poliza', {}).get('cobertura', '')
-        if poliza_cobertura:
-            item['poliza_cobertura'] = poliza_cobertura
-            
-        poliza_vigencia = user_data.get('poliza', {}).get('vigencia', '')
-        if poliza_vigencia:
-            item['poliza_vigencia'] = poliza_vigencia
-        
-        # Put item to DynamoDB
-        table.put_item(Item=item)
-        
-        print(f"💾 Datos guardados en DynamoDB exitosamente")
-        print(f"   DNI: {item['dni']}")
-        print(f"   Nombre: {item['nombre_completo']}")
-        print()
-        
-        return True
-    except ClientError as e:
-        print(f"❌ Error guardando en DynamoDB: {e.response['Error']['Message']}")
-        print()
-        return False
-    except Exception as e:
-        print(f"❌ Error inesperado guardando en DynamoDB: {str(e)}")
-        print()
-        return False
+
+# Shared by every BedrockStreamManager in this process
+client_registry = BedrockClientRegistry()
 
 class ToolProcessor:
-    def __init__(self):
+    """Application-scoped tool executor shared by every session"""
+    
+    def __init__(self, backends=None):
         # ThreadPoolExecutor could be used for complex implementations
         self.tasks = {}
         
-        # Initialize DynamoDB client
+        # DynamoDB is initialized lazily, off the event loop, on first use
         self.dynamodb = None
+        self.table = None
         self.table_name = os.environ.get('DYNAMODB_TABLE_NAME', 'rimac-users')
+        self._dynamodb_initialized = False
+        self._dynamodb_lock = threading.Lock()
+        
+        # Writes are persisted in the background so tools return immediately
+        self.writer = DynamoWriteBehind(self.get_table)
+        
+        # Backends behind each tool (fakes with simulated latency or real adapters)
+        self.backends = backends or create_tool_backends(self._load_patient_store, self.writer, self.get_table)
+        
+        # Read-through cache in front of the clinic lookup (consent is still checked on every call)
+        self.clinic_cache = TTLCache(CLINIC_CACHE_MAX, CLINIC_CACHE_TTL_S, CLINIC_CACHE_NEGATIVE_TTL_S)
+        
+        # Duplicate suppression for side-effecting tools
+        self.idempotency = IdempotencyCache(TOOL_IDEMPOTENCY_WINDOW_S)
+    
+    @staticmethod
+    def _load_patient_store():
+        """Load affiliate records once and index them for O(1) lookups."""
         try:
-            self.dynamodb = boto3.resource('dynamodb')
-            self.table = self.dynamodb.Table(self.table_name)
-            print(f"✅ DynamoDB client initialized - Table: {self.table_name}")
-        except Exception as e:
-            print(f"⚠️  DynamoDB client initialization failed: {str(e)}")
-            print(f"   Data will not be persisted to database")
+            patient_store = PatientStore.from_file(PATIENT_DATA_PATH)
+            logger.info("Patient store loaded - %d records from %s", len(patient_store), PATIENT_DATA_PATH)
+        except (OSError, ValueError) as e:
+            patient_store = PatientStore()
+            logger.warning("Patient store could not be loaded: %s", e)
+        return patient_store
+    
+    def _initialize_dynamodb(self):
+        """Create the DynamoDB resource once; safe to call from several threads."""
+        with self._dynamodb_lock:
+            if self._dynamodb_initialized:
+                return self.table
+            try:
+                self.dynamodb = boto3.resource('dynamodb')
+                self.table = self.dynamodb.Table(self.table_name)
+                logger.info("DynamoDB client initialized - Table: %s", self.table_name)
+            except Exception as e:
+                self.dynamodb = None
+                self.table = None
+                logger.warning("DynamoDB client initialization failed, data will not be persisted: %s", e)
+            self._dynamodb_initialized = True
+            return self.table
     
-    async def process_tool_async(self, tool_name, tool_content):
+    async def get_table(self):
+        """Return the DynamoDB table, or None if DynamoDB is unavailable."""
+        if self._dynamodb_initialized:
+            return self.table
+        return await asyncio.to_thread(self._initialize_dynamodb)
+    
+    async def _fetch_clinic_record(self, dni):
+        """Look a DNI up in the clinic system; only called on cache misses."""
+        logger.debug("getInfoFromClinic: Accessing clinic database...")
+        user_data = await self.backends.clinic.lookup(dni)
+        if user_data is not None:
+            # Guardar datos en DynamoDB (en segundo plano)
+            table = await self.get_table()
+            if table is not None:
+                self.writer.submit(user_data)
+        return user_data
+    
+    @staticmethod
+    def _normalize_argument(value):
+        if isinstance(value, str):
+            return " ".join(value.lower().split())
+        if isinstance(value, dict):
+            return {key: ToolProcessor._normalize_argument(item) for key, item in value.items()}
+        if isinstance(value, list):
+            return [ToolProcessor._normalize_argument(item) for item in value]
+        return value
+    
+    def _idempotency_key(self, tool, tool_content, session_id):
+        """Key identifying repeats of a side-effecting call, or None for tools that are not deduplicated."""
+        if tool not in ("registeruser", "callambulance"):
+            return None
+        try:
+            content_data = json.loads(tool_content.get("content", "{}"))
+        except (TypeError, ValueError):
+            return None
+        # Only exact repeats within a session are suppressed; corrected arguments
+        # (a fixed nombre, apellido or edad) run again
+        if tool == "registeruser" and not content_data.get("dni"):
+            return None
+        normalized = json.dumps(self._normalize_argument(content_data), sort_keys=True)
+        return (tool, session_id, hashlib.sha256(normalized.encode('utf-8')).hexdigest())
+    
+    async def process_tool_async(self, tool_name, tool_content, session_id=None):
         """Process a tool call asynchronously and return the result"""
+        key = self._idempotency_key(tool_name.lower(), tool_content, session_id)
+        if key is not None:
+            return await self.idempotency.run(
+                key, tool_name.lower(), lambda: self._process_tool(tool_name, tool_content, session_id))
+        return await self._process_tool(tool_name, tool_content, session_id)
+    
+    async def _process_tool(self, tool_name, tool_content, session_id=None):
         # Create a unique task ID
         task_id = str(uuid.uuid4())
         
         # Create and store the task
-        task = asyncio.create_task(self._run_tool(tool_name, tool_content))
+        task = asyncio.create_task(self._run_tool(tool_name, tool_content, session_id))
         self.tasks[task_id] = task
         
         try:
@@ -141,33 +253,21 @@ class ToolProcessor:
             if task_id in self.tasks:
                 del self.tasks[task_id]
     
-    async def _run_tool(self, tool_name, tool_content):
+    async def _run_tool(self, tool_name, tool_content, session_id=None):
         """Internal method to execute the tool logic"""
-        print(f"\n{'='*60}")
-        print(f"🔧 TOOL EXECUTION")
-        print(f"{'='*60}")
-        print(f"Tool Name: {tool_name}")
-        print(f"Tool Content: {json.dumps(tool_content, indent=2, ensure_ascii=False)}")
-        print(f"{'='*60}\n")
-        
-        debug_print(f"Processing tool: {tool_name}")
+        log = session_logger(logger, session_id, event_type="toolUse", tool=tool_name)
+        log.info("Tool execution started")
+        log.debug("Tool content: %s", tool_content)
         tool = tool_name.lower()
         
         if tool == "getinfofromclinic":
-            # Simulate API call delay
-            debug_print(f"getInfoFromClinic: Accessing clinic database...")
-            await asyncio.sleep(2)  # Simulate API latency
-            
             # Extract parameters
             content = tool_content.get("content", {})
             content_data = json.loads(content)
             dni = content_data.get("dni", "")
             user_consent = content_data.get("user_consent", False)
             
-            print(f"📋 Parametros extraidos:")
-            print(f"   DNI: {dni}")
-            print(f"   User Consent: {user_consent}")
-            print()
+            log.info("Parametros extraidos: dni=%s user_consent=%s", dni, user_consent)
             
             # Validate consent
             if not user_consent:
@@ -183,220 +283,22 @@ class ToolProcessor:
                     "error": "DNI invalido. Debe ser exactamente 8 digitos numericos"
                 }
             
-            # Base de datos simulada con DNIs fijos
-            user_database = {
-                "12345678": {
-                    "nombre": "Maria",
-                    "apellido": "Gonzales Rios",
-                    "edad": 32,
-                    "talla": "1.65m",
-                    "peso": "62kg",
-                    "enfermedades": ["Asma leve"],
-                    "historial_clinico": [
-                        {
-                            "fecha": "2024-11-10",
-                            "clinica": "Clinica Ricardo Palma",
-                            "motivo": "Control respiratorio",
-                            "diagnostico": "Evaluacion rutinaria de asma"
-                        },
-                        {
-                            "fecha": "2024-08-22",
-                            "clinica": "Clinica Ricardo Palma",
-                            "motivo": "Renovacion de receta",
-                            "diagnostico": "Inhalador para asma"
-                        }
-                    ],
-                    "poliza": {
-                        "numero": "POL-2024-001234",
-                        "tipo": "Plan Salud Integral",
-                        "estado": "Activa",
-                        "cobertura": "Nacional",
-                        "vigencia": "2024-12-31"
-                    },
-                    "rol_familiar": "Titular",
-                    "gestores_autorizados": [],
-                    "pacientes_a_cargo": [],
-                    "solicitudes_pendientes": []
-                },
-                "87654321": {
-                    "nombre": "Carlos",
-                    "apellido": "Mendoza Torres",
-                    "edad": 45,
-                    "talla": "1.78m",
-                    "peso": "85kg",
-                    "enfermedades": ["Hipertension", "Colesterol alto"],
-                    "historial_clinico": [
-                        {
-                            "fecha": "2024-10-28",
-                            "clinica": "Clinica San Felipe",
-                            "motivo": "Control cardiologico",
-                            "diagnostico": "Presion arterial controlada con medicacion"
-                        },
-                        {
-                            "fecha": "2024-09-15",
-                            "clinica": "Clinica San Felipe",
-                            "motivo": "Analisis de sangre",
-                            "diagnostico": "Colesterol en rango aceptable"
-                        },
-                        {
-                            "fecha": "2024-07-05",
-                            "clinica": "Clinica Internacional",
-                            "motivo": "Consulta cardiologia",
-                            "diagnostico": "Ajuste de medicacion"
-                        }
-                    ],
-                    "poliza": {
-                        "numero": "POL-2023-005678",
-                        "tipo": "Plan Salud Total Plus",
-                        "estado": "Activa",
-                        "cobertura": "Nacional e Internacional",
-                        "vigencia": "2025-06-30"
-                    },
-                    "rol_familiar": "Padre",
-                    "gestores_autorizados": ["87654321"],
-                    "pacientes_a_cargo": [],
-                    "solicitudes_pendientes": [
-                        {"de_dni": "87654321", "nombre": "Maria (Hija)", "estado": "PENDIENTE"}
-                    ]
-                },
-                "11223344": {
-                    "nombre": "Ana",
-                    "apellido": "Flores Castillo",
-                    "edad": 28,
-                    "talla": "1.60m",
-                    "peso": "55kg",
-                    "enfermedades": [],
-                    "historial_clinico": [
-                        {
-                            "fecha": "2024-11-01",
-                            "clinica": "Clinica Delgado",
-                            "motivo": "Chequeo preventivo anual",
-                            "diagnostico": "Estado de salud excelente"
-                        }
-                    ],
-                    "poliza": {
-                        "numero": "POL-2024-009012",
-                        "tipo": "Plan Salud Joven",
-                        "estado": "Activa",
-                        "cobertura": "Nacional",
-                        "vigencia": "2025-03-15"
-                    },
-                    "rol_familiar": "Titular",
-                    "gestores_autorizados": [],
-                    "pacientes_a_cargo": [],
-                    "solicitudes_pendientes": []
-                },
-                "55667788": {
-                    "nombre": "Roberto",
-                    "apellido": "Vega Sanchez",
-                    "edad": 58,
-                    "talla": "1.72m",
-                    "peso": "92kg",
-                    "enfermedades": ["Diabetes tipo 2", "Hipertension", "Artritis"],
-                    "historial_clinico": [
-                        {
-                            "fecha": "2024-11-18",
-                            "clinica": "Clinica Americana",
-                            "motivo": "Control diabetologico",
-                            "diagnostico": "Glucosa en niveles manejables"
-                        },
-                        {
-                            "fecha": "2024-10-10",
-                            "clinica": "Clinica Americana",
-                            "motivo": "Consulta reumatologia",
-                            "diagnostico": "Tratamiento para artritis en rodillas"
-                        },
-                        {
-                            "fecha": "2024-09-02",
-                            "clinica": "Clinica San Borja",
-                            "motivo": "Control presion arterial",
-                            "diagnostico": "Ajuste de dosis de antihipertensivos"
-                        },
-                        {
-                            "fecha": "2024-07-20",
-                            "clinica": "Clinica Americana",
-                            "motivo": "Evaluacion integral",
-                            "diagnostico": "Seguimiento de enfermedades cronicas"
-                        }
-                    ],
-                    "poliza": {
-                        "numero": "POL-2022-003456",
-                        "tipo": "Plan Salud Senior",
-                        "estado": "Activa",
-                        "cobertura": "Nacional e Internacional",
-                        "vigencia": "2025-12-31"
-                    },
-                    "rol_familiar": "Titular",
-                    "gestores_autorizados": [],
-                    "pacientes_a_cargo": [],
-                    "solicitudes_pendientes": []
-                },
-                "99887766": {
-                    "nombre": "Lucia",
-                    "apellido": "Ramirez Diaz",
-                    "edad": 38,
-                    "talla": "1.68m",
-                    "peso": "68kg",
-                    "enfermedades": ["Migrana cronica"],
-                    "historial_clinico": [
-                        {
-                            "fecha": "2024-11-05",
-                            "clinica": "Clinica Anglo Americana",
-                            "motivo": "Consulta neurologia",
-                            "diagnostico": "Tratamiento preventivo para migrana"
-                        },
-                        {
-                            "fecha": "2024-08-14",
-                            "clinica": "Clinica Anglo Americana",
-                            "motivo": "Seguimiento neurologico",
-                            "diagnostico": "Ajuste de medicacion"
-                        }
-                    ],
-                    "poliza": {
-                        "numero": "POL-2024-007890",
-                        "tipo": "Plan Salud Integral",
-                        "estado": "Activa",
-                        "cobertura": "Nacional",
-                        "vigencia": "2025-09-20"
-                    },
-                    "rol_familiar": "Titular",
-                    "gestores_autorizados": [],
-                    "pacientes_a_cargo": [],
-                    "solicitudes_pendientes": []
-                }
-            }
-            
-            # Buscar usuario en la base de datos
-            if dni in user_database:
-                user_data = user_database[dni].copy()
-                user_data["dni"] = dni
-                print(f"✅ Usuario encontrado: {user_data['nombre']} {user_data['apellido']}")
-                print(f"   Edad: {user_data['edad']} anos")
-                print(f"   Poliza: {user_data['poliza']['numero']} ({user_data['poliza']['tipo']})")
-                print()
-                
-                # Guardar datos en DynamoDB
-                if self.dynamodb:
-                    save_to_dynamodb(self.table, user_data)
-                
-                debug_print(f"getInfoFromClinic: Usuario encontrado - {user_data['nombre']} {user_data['apellido']}")
+            # Buscar usuario (cache de lectura delante de la clinica)
+            user_data = await self.clinic_cache.get_or_load(dni, self._fetch_clinic_record)
+            if user_data is not None:
+                log.info("Usuario encontrado: dni=%s poliza=%s", dni, (user_data.get('poliza') or {}).get('numero'))
                 return {
                     "success": True,
                     "user_data": user_data
                 }
             else:
-                print(f"❌ DNI {dni} no encontrado en base de datos")
-                print()
-                debug_print(f"getInfoFromClinic: DNI {dni} no encontrado en base de datos")
+                log.info("DNI %s no encontrado en base de datos", dni)
                 return {
                     "success": False,
                     "error": f"No se encontro informacion para el DNI {dni} en el sistema de la clinica afiliada. Desea intentar con otro DNI o prefiere registrar sus datos manualmente?"
                 }
         
         elif tool == "registeruser":
-            debug_print(f"registerUser: Registering new user...")
-            await asyncio.sleep(1)
-            
             # Extract parameters
             content = tool_content.get("content", {})
             content_data = json.loads(content)
@@ -408,14 +310,7 @@ class ToolProcessor:
             talla = content_data.get("talla", "")
             enfermedades = content_data.get("enfermedades", [])
             
-            print(f"📋 Parametros extraidos:")
-            print(f"   DNI: {dni}")
-            print(f"   Nombre: {nombre} {apellido}")
-            print(f"   Edad: {edad} anos")
-            print(f"   Peso: {peso}")
-            print(f"   Talla: {talla}")
-            print(f"   Enfermedades: {enfermedades if enfermedades else 'Ninguna'}")
-            print()
+            log.info("Parametros extraidos: dni=%s edad=%s enfermedades=%d", dni, edad, len(enfermedades or []))
             
             # Validate DNI format
             if not dni or not isinstance(dni, str) or len(dni) != 8 or not dni.isdigit():
@@ -460,56 +355,46 @@ class ToolProcessor:
                 "solicitudes_pendientes": []
             }
             
-            # Save to DynamoDB
-            if self.dynamodb:
-                save_success = save_to_dynamodb(self.table, user_data)
-                if save_success:
-                    print(f"✅ Usuario {nombre} {apellido} registrado exitosamente")
-                    print()
-                    debug_print(f"registerUser: Usuario {nombre} {apellido} guardado en DynamoDB")
-                    return {
-                        "success": True,
-                        "message": f"Usuario {nombre} {apellido} (DNI: {dni}) registrado exitosamente en el sistema.",
-                        "user_data": user_data
-                    }
-                else:
-                    return {
-                        "success": False,
-                        "error": "Error al guardar usuario en la base de datos. Por favor intente nuevamente."
-                    }
-            else:
+            # Save through the registration backend (DynamoDB write-behind by default)
+            try:
+                save_success = await self.backends.registration.register(user_data)
+            except BackendUnavailableError:
                 return {
                     "success": False,
                     "error": "Sistema de base de datos no disponible. No se pudo registrar el usuario."
                 }
+            if save_success:
+                log.info("Usuario registrado: dni=%s", dni)
+                return {
+                    "success": True,
+                    "message": f"Usuario {nombre} {apellido} (DNI: {dni}) registrado exitosamente en el sistema.",
+                    "user_data": user_data
+                }
+            else:
+                return {
+                    "success": False,
+                    "error": "Error al guardar usuario en la base de datos. Por favor intente nuevamente."
+                }
         
         elif tool == "callambulance":
-            debug_print(f"callAmbulance: EMERGENCIA - Calling ambulance...")
-            
             # Extract parameters
             content = tool_content.get("content", {})
             content_data = json.loads(content)
             sintomas = content_data.get("sintomas", "")
             ubicacion = content_data.get("ubicacion", "Ubicacion del usuario registrada en el sistema")
             
-            print(f"\n{'='*60}")
-            print(f"⚠️  ALERTA DE EMERGENCIA - AMBULANCIA SOLICITADA")
-            print(f"{'='*60}")
-            print(f"🚑 Sintomas reportados: {sintomas}")
-            print(f"📍 Ubicacion: {ubicacion}")
-            print(f"⏱️  Ambulancia despachada - Tiempo estimado de llegada: 8-12 minutos")
-            print(f"{'='*60}\n")
+            log.warning("ALERTA DE EMERGENCIA - ambulancia solicitada: sintomas=%s ubicacion=%s", sintomas, ubicacion)
             
-            # Simulate emergency dispatch delay
-            await asyncio.sleep(1)
+            dispatch = await self.backends.ambulance.dispatch(sintomas, ubicacion)
+            eta_minutes = dispatch.get("eta_minutes", "8-12")
             
-            debug_print(f"callAmbulance: Ambulancia despachada exitosamente")
+            log.warning("Ambulancia despachada - Tiempo estimado de llegada: %s minutos", eta_minutes)
             
             return {
                 "success": True,
                 "emergency_type": "AMBULANCIA_DESPACHADA",
-                "message": "AMBULANCIA EN CAMINO. Una ambulancia ha sido alertada y esta en camino a tu ubicacion. Tiempo estimado de llegada: 8-12 minutos.",
-                "eta_minutes": "8-12",
+                "message": f"AMBULANCIA EN CAMINO. Una ambulancia ha sido alertada y esta en camino a tu ubicacion. Tiempo estimado de llegada: {eta_minutes} minutos.",
+                "eta_minutes": eta_minutes,
                 "instructions": "Mantente tranquilo. Si es posible, permanece en un lugar seguro y visible. La ambulancia llegara pronto.",
                 "emergency_number": "106",
                 "sintomas": sintomas,
@@ -521,22 +406,20 @@ class ToolProcessor:
                 "error": f"Herramienta no soportada: {tool_name}"
             }
 
+# Shared by every session in this process, see get_tool_processor()
+_tool_processor = None
+
+def get_tool_processor():
+    """Return the process-wide ToolProcessor, creating it on first use."""
+    global _tool_processor
+    if _tool_processor is None:
+        _tool_processor = ToolProcessor()
+    return _tool_processor
+
 class BedrockStreamManager:
     """Manages bidirectional streaming with AWS Bedrock using asyncio"""
     
     # Event templates
-    START_SESSION_EVENT = '''{
-        "event": {
-            "sessionStart": {
-            "inferenceConfiguration": {
-                "maxTokens": 1024,
-                "topP": 0.9,
-                "temperature": 0.7
-                }
-            }
-        }
-    }'''
-
     CONTENT_START_EVENT = '''{
         "event": {
             "contentStart": {
@@ -557,41 +440,6 @@ class BedrockStreamManager:
         }
     }'''
 
-    AUDIO_EVENT_TEMPLATE = '''{
-        "event": {
-            "audioInput": {
-            "promptName": "%s",
-            "contentName": "%s",
-            "content": "%s"
-            }
-        }
-    }'''
-
-    TEXT_CONTENT_START_EVENT = '''{
-        "event": {
-            "contentStart": {
-            "promptName": "%s",
-            "contentName": "%s",
-            "type": "TEXT",
-            "role": "%s",
-            "interactive": false,
-                "textInputConfiguration": {
-                    "mediaType": "text/plain"
-                }
-            }
-        }
-    }'''
-
-    TEXT_INPUT_EVENT = '''{
-        "event": {
-            "textInput": {
-            "promptName": "%s",
-            "contentName": "%s",
-            "content": "%s"
-            }
-        }
-    }'''
-
     TOOL_CONTENT_START_EVENT = '''{
         "event": {
             "contentStart": {
@@ -634,131 +482,6 @@ class BedrockStreamManager:
         }
     }'''
     
-    def start_prompt(self):
-        """Create a promptStart event"""
-        get_info_from_clinic_schema = json.dumps({
-            "type": "object",
-            "properties": {
-                "dni": {
-                    "type": "string",
-                    "description": "Numero de DNI del usuario (debe ser exactamente 8 digitos numericos)"
-                },
-                "user_consent": {
-                    "type": "boolean",
-                    "description": "Confirmacion explicita del usuario para acceder a su informacion de la clinica afiliada"
-                }
-            },
-            "required": ["dni", "user_consent"]
-        })
-
-        register_user_schema = json.dumps({
-            "type": "object",
-            "properties": {
-                "dni": {
-                    "type": "string",
-                    "description": "Numero de DNI del usuario (8 digitos)"
-                },
-                "nombre": {
-                    "type": "string",
-                    "description": "Nombre del usuario"
-                },
-                "apellido": {
-                    "type": "string",
-                    "description": "Apellido del usuario"
-                },
-                "edad": {
-                    "type": "integer",
-                    "description": "Edad del usuario en anos"
-                },
-                "peso": {
-                    "type": "string",
-                    "description": "Peso del usuario (ejemplo: 70kg)"
-                },
-                "talla": {
-                    "type": "string",
-                    "description": "Talla o altura del usuario (ejemplo: 1.75m)"
-                },
-                "enfermedades": {
-                    "type": "array",
-                    "items": {"type": "string"},
-                    "description": "Lista de enfermedades que tiene el usuario (puede estar vacio si no tiene ninguna)"
-                }
-            },
-            "required": ["dni", "nombre", "apellido", "edad", "peso", "talla", "enfermedades"]
-        })
-
-        call_ambulance_schema = json.dumps({
-            "type": "object",
-            "properties": {
-                "sintomas": {
-                    "type": "string",
-                    "description": "Descripcion de los sintomas de emergencia del paciente"
-                },
-                "ubicacion": {
-                    "type": "string",
-                    "description": "Ubicacion actual del paciente (si esta disponible)"
-                }
-            },
-            "required": ["sintomas"]
-        })
-
-        
-        prompt_start_event = {
-            "event": {
-                "promptStart": {
-                    "promptName": self.prompt_name,
-                    "textOutputConfiguration": {
-                        "mediaType": "text/plain"
-                    },
-                    "audioOutputConfiguration": {
-                        "mediaType": "audio/lpcm",
-                        "sampleRateHertz": 24000,
-                        "sampleSizeBits": 16,
-                        "channelCount": 1,
-                        "voiceId": "matthew",
-                        "encoding": "base64",
-                        "audioType": "SPEECH"
-                    },
-                    "toolUseOutputConfiguration": {
-                        "mediaType": "application/json"
-                    },
-                    "toolConfiguration": {
-                        "tools": [
-                            {
-                                "toolSpec": {
-                                    "name": "getInfoFromClinic",
-                                    "description": "Obtiene informacion del usuario desde su clinica afiliada. USA ESTA TOOL SOLO cuando el usuario diga SI, ACEPTO, CLARO, OK o similar al permiso. Si el usuario solo saluda, NO uses esta tool todavia. Parametros: dni (8 digitos) y user_consent DEBE SER true solo si usuario acepto explicitamente.",
-                                    "inputSchema": {
-                                        "json": get_info_from_clinic_schema
-                                    }
-                                }
-                            },
-                            {
-                                "toolSpec": {
-                                    "name": "registerUser",
-                                    "description": "Registra manualmente los datos basicos de un nuevo usuario en el sistema. Usar solo cuando el usuario NO da permiso para acceder a informacion de su clinica o cuando no se encuentra su DNI en el sistema.",
-                                    "inputSchema": {
-                                        "json": register_user_schema
-                                    }
-                                }
-                            },
-                            {
-                                "toolSpec": {
-                                    "name": "callAmbulance",
-                                    "description": "EMERGENCIA VITAL: Llama a una ambulancia de inmediato. USA ESTA TOOL SOLO cuando detectes sintomas de emergencia vital como: dolor en el pecho, dificultad para respirar severa, perdida de conciencia, sangrado severo, dolor abdominal intenso con fiebre alta, convulsiones, trauma grave, sintomas de infarto o derrame cerebral. NO usar para urgencias menores.",
-                                    "inputSchema": {
-                                        "json": call_ambulance_schema
-                                    }
-                                }
-                            }
-                        ]
-                    }
-                }
-            }
-        }
-        
-        return json.dumps(prompt_start_event)
-    
     def tool_result_event(self, content_name, content, role):
         """Create a tool result event"""
 
@@ -778,22 +501,42 @@ class BedrockStreamManager:
         }
         return json.dumps(tool_result_event)
    
-    def __init__(self, model_id='amazon.nova-sonic-v1:0', region='us-east-1', websocket=None):
+    def __init__(self, model_id='amazon.nova-sonic-v1:0', region='us-east-1', client=None, audio_output='base64', tool_processor=None):
         """Initialize the stream manager."""
         self.model_id = model_id
         self.region = region
-        self.websocket = websocket  # WebSocket connection to send responses to client
+        self.client = client  # ClientSender that owns the WebSocket connection to the client
+        self.audio_output = audio_output  # "base64" JSON messages or "binary" PCM frames
+        self.audio_output_sequence = 0
         
         # Replace RxPy subjects with asyncio queues
-        self.audio_input_queue = asyncio.Queue()
+        self.audio_input_queue = AudioIngestQueue(AUDIO_INPUT_QUEUE_MAX, AUDIO_INPUT_QUEUE_POLICY, AUDIO_INPUT_QUEUE_MAX_MS)
         self.audio_output_queue = asyncio.Queue()
-        self.output_queue = asyncio.Queue()
+        
+        # Observers of Bedrock output events (recorders, metrics, tests).
+        # Events are only retained while someone is subscribed.
+        self.event_subscribers = []
+        self.event_callbacks = []
+        self.dropped_subscriber_events = 0
+        self.audio_coalescer = AudioCoalescer(AUDIO_COALESCE_MS, AUDIO_COALESCE_MAX_DELAY_MS)
         
         self.response_task = None
+        self.audio_task = None
+        self.response_ready = None
         self.stream_response = None
         self.is_active = False
+        self.audio_content_started = False
+        # Set when the user interrupts the assistant; audio output is dropped until
+        # the next assistant AUDIO content block starts
         self.barge_in = False
+        self.dropped_audio_frames = 0
+        self.audio_input_stats_logged = False
+        # When the last user turn ended, until the first assistant audio of the response
+        self.user_turn_ended_at = None
         self.bedrock_client = None
+        # prompt_registry version the stream was initialized with
+        self.prompt_version = None
+        self.client_leased = False
         
         # Text response components
         self.display_assistant_text = False
@@ -801,26 +544,53 @@ class BedrockStreamManager:
 
         # Session information
         self.prompt_name = str(uuid.uuid4())
+        # Every record from this session carries its prompt name as session_id
+        self.log = session_logger(logger, self.prompt_name)
         self.content_name = str(uuid.uuid4())
         self.audio_content_name = str(uuid.uuid4())
-        self.toolUseContent = ""
-        self.toolUseId = ""
-        self.toolName = ""
+        self.audio_event_encoder = AudioEventEncoder(self.prompt_name, self.audio_content_name)
+        # toolUse events waiting for their TOOL contentEnd, keyed by contentId
+        self.tool_uses = {}
 
-        # Add a tool processor
-        self.tool_processor = ToolProcessor()
+        # Tools are an application-scoped service shared across sessions
+        self.tool_processor = tool_processor or get_tool_processor()
         
-        # Add tracking for in-progress tool calls
+        # Add tracking for in-progress tool calls, keyed by toolUseId
         self.pending_tool_tasks = {}
+        # Keeps the start/result/end events of concurrent tool results from interleaving
+        self.tool_result_lock = asyncio.Lock()
+        # Eagerly started tool executions, keyed by toolUseId
+        self.eager_tool_tasks = {}
+
+        # Output event handlers, keyed by event type
+        self.event_handlers = {
+            'completionStart': self._on_completion_start,
+            'contentStart': self._on_content_start,
+            'textOutput': self._on_text_output,
+            'audioOutput': self._on_audio_output,
+            'toolUse': self._on_tool_use,
+            'contentEnd': self._on_content_end,
+            'completionEnd': self._on_completion_end,
+            'usageEvent': self._on_usage_event
+        }
+
+    def attach(self, client, audio_output='base64'):
+        """Bind an already initialized stream to a client connection."""
+        self.client = client
+        self.audio_output = audio_output
+        self.audio_output_sequence = 0
+        return self
 
     def _initialize_client(self):
-        """Initialize the Bedrock client."""
-        config = Config(
-            endpoint_uri=f"https://bedrock-runtime.{self.region}.amazonaws.com",
-            region=self.region,
-            aws_credentials_identity_resolver=EnvironmentCredentialsResolver(),
-        )
-        self.bedrock_client = BedrockRuntimeClient(config=config)
+        """Take a shared Bedrock client from the process-wide registry."""
+        self.bedrock_client = client_registry.acquire(self.region)
+        self.client_leased = True
+    
+    def _release_client(self):
+        """Return the stream slot on the shared client, if this session holds one."""
+        if self.client_leased:
+            client_registry.release(self.bedrock_client)
+            self.client_leased = False
     
     async def initialize_stream(self):
         """Initialize the bidirectional stream with Bedrock."""
@@ -830,306 +600,188 @@ class BedrockStreamManager:
         try:
             self.stream_response = await time_it_async("invoke_model_with_bidirectional_stream", lambda : self.bedrock_client.invoke_model_with_bidirectional_stream( InvokeModelWithBidirectionalStreamOperationInput(model_id=self.model_id)))
             self.is_active = True
-            # Get current date and time in Peru timezone
-            peru_tz = pytz.timezone('America/Lima')
-            current_datetime = datetime.datetime.now(peru_tz)
-            fecha_hora_actual = current_datetime.strftime('%Y-%m-%d %H:%M:%S')
-            
-            default_system_prompt = f"""Eres RIMI, el asistente virtual de Rimac Seguros, empresa lider en seguros en Peru. Tu objetivo es ayudar a los usuarios a obtener atencion medica rapida y eficiente.
-
-FECHA Y HORA ACTUAL: {fecha_hora_actual} (Zona horaria: America/Lima)
-
-IDIOMA: Hablas UNICAMENTE en ESPANOL en todo momento. Nunca uses ingles.
-
-TRIAGE CLINICO - PRIORIDAD MAXIMA:
-Cuando el usuario mencione sintomas, PRIMERO evalua la gravedad:
-
-EMERGENCIA VITAL (USA callAmbulance INMEDIATAMENTE):
-- Dolor en el pecho o presion en el pecho
-- Dificultad severa para respirar o falta de aire
-- Perdida de conciencia o desmayo
-- Sangrado severo que no se detiene
-- Dolor abdominal intenso con fiebre alta (>39C)
-- Convulsiones
-- Trauma grave (caidas, accidentes)
-- Sintomas de infarto: dolor en brazo izquierdo, mandibula, sudoracion fria
-- Sintomas de derrame cerebral: confusion, dificultad para hablar, paralisis facial
-- Reaccion alergica severa (dificultad para respirar, hinchazon)
-
-URGENCIA MENOR (Analiza y recomienda clinica):
-- Fiebre moderada con otros sintomas
-- Dolor de estomago o gastrico
-- Vomitos o diarrea
-- Dolor de cabeza intenso
-- Lesiones menores
-- Sintomas de infeccion
-
-FLUJO DE CONVERSACION:
-1) Saluda brevemente y presentate como asistente de Rimac Seguros
-2) Solicita permiso para acceder a datos de clinica afiliada para ayudarlos mejor
-3) ESPERA la respuesta del usuario
-4) Si dice SI/ACEPTO/OK/CLARO, pide DNI de 8 digitos y ENTONCES usa getInfoFromClinic con user_consent=true
-5) Si dice NO al permiso: Inicia registro manual preguntando por DNI, nombre, apellido, edad, peso, talla y enfermedades
-6) IMPORTANTE: Una vez que tengas TODOS los datos del registro manual (dni, nombre, apellido, edad, peso, talla, enfermedades), EJECUTA registerUser INMEDIATAMENTE. NO continues la conversacion sin ejecutar la tool primero.
-7) Despues de ejecutar registerUser exitosamente, di: 'Perfecto, [nombre]. Ya tengo tu informacion registrada. En que puedo ayudarte hoy?'
-8) Pregunta especificamente: "Necesitas atencion para ti o para un familiar? Que sintomas o motivo de consulta tienes?"
-9) TRIAGE: Cuando el usuario mencione sintomas, evalua si es emergencia vital o urgencia menor
-10) Si es EMERGENCIA VITAL: USA callAmbulance INMEDIATAMENTE antes de cualquier otra cosa
-11) Si es urgencia menor: Responde "Entiendo. Por tus sintomas, podria ser [diagnostico tentativo]. Analizando tus mejores opciones..." y proporciona guia
-
-GUIA RAPIDA PARA ATENCION EN CLINICA (usala cuando el usuario necesite ir a una clinica):
-- Clinicas disponibles en tu red: [menciona 2-3 cercanas segun su historial]
-- Para atencion de emergencia: Ve directo a emergencias con tu DNI
-- Para consulta programada: Puedes agendar por app, web o llamando al centro de contacto
-- Documentos necesarios: Solo tu DNI
-- Cobertura: Tu plan [tipo de plan] cubre [tipo de cobertura]
-- Tip: Si vas en horario no punta (10am-3pm), la espera es menor
-
-IMPORTANTE:
-- NO leas todos los datos del usuario (historial, enfermedades, etc.) a menos que el lo solicite
-- Se conversacional, breve y directo
-- Los datos son solo para tu contexto interno
-- Enfocate en lo que el usuario necesita AHORA
-- Si dice NO al permiso, ofrece registro manual con registerUser
-
-CRITICO: NO uses tools hasta que usuario ACEPTE explicitamente."""
-            
-            # Send initialization events
-            prompt_event = self.start_prompt()
-            text_content_start = self.TEXT_CONTENT_START_EVENT % (self.prompt_name, self.content_name, "SYSTEM")
-            # Escape the prompt content properly for JSON
-            escaped_prompt = json.dumps(default_system_prompt)[1:-1]  # Remove surrounding quotes
-            text_content = self.TEXT_INPUT_EVENT % (self.prompt_name, self.content_name, escaped_prompt)
-            text_content_end = self.CONTENT_END_EVENT % (self.prompt_name, self.content_name)
-            
-            init_events = [self.START_SESSION_EVENT, prompt_event, text_content_start, text_content, text_content_end]
+            # sessionStart, promptStart and the system prompt are pre-encoded; only the
+            # prompt/content names and the Lima timestamp are spliced in per session
+            init_events = prompt_registry.init_events(self.prompt_name, self.content_name)
+            self.prompt_version = prompt_registry.version
             
+            # The single input stream preserves ordering, so no delay is needed between events
             for event in init_events:
                 await self.send_raw_event(event)
-                # Small delay between init events
-                await asyncio.sleep(0.1)
             
             # Start listening for responses
+            self.response_ready = asyncio.Event()
             self.response_task = asyncio.create_task(self._process_responses())
             
             # Start processing audio input
-            asyncio.create_task(self._process_audio_input())
+            self.audio_task = asyncio.create_task(self._process_audio_input())
             
-            # Wait a bit to ensure everything is set up
-            await asyncio.sleep(0.1)
+            # Ready once the response loop is actually running
+            await self.response_ready.wait()
             
-            debug_print("Stream initialized successfully")
+            self.log.info("Stream initialized")
             return self
         except Exception as e:
             self.is_active = False
-            print(f"Failed to initialize stream: {str(e)}")
+            self._release_client()
+            self.log.error("Failed to initialize stream: %s", e)
             raise
     
-    async def send_raw_event(self, event_json):
-        """Send a raw event JSON to the Bedrock stream."""
+    async def send_raw_event(self, event_json, event_type=None):
+        """Send a raw event JSON (str or pre-encoded bytes) to the Bedrock stream."""
         if not self.stream_response or not self.is_active:
-            debug_print("Stream not initialized or closed")
+            self.log.debug("Stream not initialized or closed")
             return
        
+        if isinstance(event_json, str):
+            event_json = event_json.encode('utf-8')
+        BEDROCK_EVENTS_SENT.inc(event_type or output_events.event_type(event_json) or "unknown")
         event = InvokeModelWithBidirectionalStreamInputChunk(
-            value=BidirectionalInputPayloadPart(bytes_=event_json.encode('utf-8'))
+            value=BidirectionalInputPayloadPart(bytes_=event_json)
         )
         
         try:
             await self.stream_response.input_stream.send(event)
             # For debugging large events, you might want to log just the type
-            if DEBUG:
+            if self.log.isEnabledFor(logging.DEBUG):
                 if len(event_json) > 200:
-                    event_type = json.loads(event_json).get("event", {}).keys()
-                    debug_print(f"Sent event type: {list(event_type)}")
+                    self.log.debug("Sent event", extra={"event_type": event_type or output_events.event_type(event_json)})
                 else:
-                    debug_print(f"Sent event: {event_json}")
+                    self.log.debug("Sent event: %s", event_json.decode('utf-8'))
         except Exception as e:
-            debug_print(f"Error sending event: {str(e)}")
-            if DEBUG:
-                import traceback
-                traceback.print_exc()
+            self.log.warning("Error sending event: %s", e, exc_info=self.log.isEnabledFor(logging.DEBUG))
     
     async def send_audio_content_start_event(self):
         """Send a content start event to the Bedrock stream."""
         content_start_event = self.CONTENT_START_EVENT % (self.prompt_name, self.audio_content_name)
         await self.send_raw_event(content_start_event)
+        self.audio_content_started = True
+    
+    async def _send_audio_event(self, audio_base64):
+        """Send one audioInput event with already base64-encoded content."""
+        await self.send_raw_event(self.audio_event_encoder.encode(audio_base64), 'audioInput')
+    
+    async def _send_audio_frame(self, audio_bytes):
+        """Base64 encode a PCM frame and send it as an audioInput event."""
+        if audio_bytes:
+            await self.send_raw_event(self.audio_event_encoder.encode_pcm(audio_bytes), 'audioInput')
     
     async def _process_audio_input(self):
-        """Process audio input from the queue and send to Bedrock."""
+        """Process audio input from the queue, coalesce it into frames and send to Bedrock."""
         while self.is_active:
             try:
-                # Get audio data from the queue
-                data = await self.audio_input_queue.get()
-                
-                audio_bytes = data.get('audio_bytes')
-                if not audio_bytes:
-                    debug_print("No audio bytes received")
-                    continue
+                # Get audio data from the queue, waking up to flush stale buffered audio
+                flush_timeout = self.audio_coalescer.time_until_flush()
+                if flush_timeout is None:
+                    data = await self.audio_input_queue.get()
+                else:
+                    try:
+                        data = await asyncio.wait_for(self.audio_input_queue.get(), flush_timeout)
+                    except asyncio.TimeoutError:
+                        await self._send_audio_frame(self.audio_coalescer.flush())
+                        continue
                 
-                # Base64 encode the audio data
-                blob = base64.b64encode(audio_bytes)
-                audio_event = self.AUDIO_EVENT_TEMPLATE % (
-                    self.prompt_name, 
-                    self.audio_content_name, 
-                    blob.decode('utf-8')
-                )
+                audio_base64 = data.get('audio_base64')
+                if audio_base64 is not None:
+                    # Chunks that already fill a frame are passed through without decoding
+                    if not self.audio_coalescer.pending and len(audio_base64) * 3 // 4 >= self.audio_coalescer.target_bytes:
+                        await self._send_audio_event(audio_base64)
+                        continue
+                    audio_bytes = base64.b64decode(audio_base64)
+                else:
+                    audio_bytes = data.get('audio_bytes')
+                    if not audio_bytes:
+                        self.log.debug("No audio bytes received")
+                        continue
                 
-                # Send the event
-                await self.send_raw_event(audio_event)
+                await self._send_audio_frame(self.audio_coalescer.add(audio_bytes))
                 
             except asyncio.CancelledError:
                 break
             except Exception as e:
-                debug_print(f"Error processing audio: {e}")
-                if DEBUG:
-                    import traceback
-                    traceback.print_exc()
+                self.log.warning("Error processing audio: %s", e, exc_info=self.log.isEnabledFor(logging.DEBUG))
     
-    def add_audio_chunk(self, audio_bytes):
+    async def add_audio_chunk(self, audio_bytes):
         """Add an audio chunk to the queue."""
-        self.audio_input_queue.put_nowait({
+        await self.audio_input_queue.put({
             'audio_bytes': audio_bytes,
             'prompt_name': self.prompt_name,
             'content_name': self.audio_content_name
-        })
+        }, len(audio_bytes) / INPUT_BYTES_PER_MS)
+    
+    async def add_audio_base64(self, audio_base64):
+        """Add an already base64-encoded audio chunk to the queue without decoding it."""
+        await self.audio_input_queue.put({
+            'audio_base64': audio_base64,
+            'prompt_name': self.prompt_name,
+            'content_name': self.audio_content_name
+        }, len(audio_base64) * 3 / 4 / INPUT_BYTES_PER_MS)
     
     async def send_audio_content_end_event(self):
         """Send a content end event to the Bedrock stream."""
         if not self.is_active:
-            debug_print("Stream is not active")
+            self.log.debug("Stream is not active")
+            return
+        
+        # Pre-warmed streams that were never handed out have no audio content to end
+        if not self.audio_content_started:
             return
         
         content_end_event = self.CONTENT_END_EVENT % (self.prompt_name, self.audio_content_name)
         await self.send_raw_event(content_end_event)
-        debug_print("Audio ended")
+        self.log.debug("Audio ended")
     
     async def send_tool_start_event(self, content_name, tool_use_id):
         """Send a tool content start event to the Bedrock stream."""
         content_start_event = self.TOOL_CONTENT_START_EVENT % (self.prompt_name, content_name, tool_use_id)
-        debug_print(f"Sending tool start event: {content_start_event}")  
+        self.log.debug("Sending tool start event: %s", content_start_event, extra={"event_type": "contentStart"})
         await self.send_raw_event(content_start_event)
 
     async def send_tool_result_event(self, content_name, tool_result):
         """Send a tool content event to the Bedrock stream."""
         # Use the actual tool result from processToolUse
         tool_result_event = self.tool_result_event(content_name=content_name, content=tool_result, role="TOOL")
-        debug_print(f"Sending tool result event: {tool_result_event}")
+        self.log.debug("Sending tool result event: %s", tool_result_event, extra={"event_type": "toolResult"})
         await self.send_raw_event(tool_result_event)
     
     async def send_tool_content_end_event(self, content_name):
         """Send a tool content end event to the Bedrock stream."""
         tool_content_end_event = self.CONTENT_END_EVENT % (self.prompt_name, content_name)
-        debug_print(f"Sending tool content event: {tool_content_end_event}")
+        self.log.debug("Sending tool content event: %s", tool_content_end_event, extra={"event_type": "contentEnd"})
         await self.send_raw_event(tool_content_end_event)
     
     async def send_prompt_end_event(self):
         """Close the stream and clean up resources."""
         if not self.is_active:
-            debug_print("Stream is not active")
+            self.log.debug("Stream is not active")
             return
         
         prompt_end_event = self.PROMPT_END_EVENT % (self.prompt_name)
         await self.send_raw_event(prompt_end_event)
-        debug_print("Prompt ended")
+        self.log.debug("Prompt ended")
         
     async def send_session_end_event(self):
         """Send a session end event to the Bedrock stream."""
         if not self.is_active:
-            debug_print("Stream is not active")
+            self.log.debug("Stream is not active")
             return
 
         await self.send_raw_event(self.SESSION_END_EVENT)
         self.is_active = False
-        debug_print("Session ended")
+        self.audio_input_queue.close()
+        self.log.debug("Session ended")
     
     async def _process_responses(self):
         """Process incoming responses from Bedrock."""
+        if self.response_ready:
+            self.response_ready.set()
         try:            
             while self.is_active:
                 try:
                     output = await self.stream_response.await_output()
                     result = await output[1].receive()
                     if result.value and result.value.bytes_:
-                        try:
-                            response_data = result.value.bytes_.decode('utf-8')
-                            json_data = json.loads(response_data)
-                            
-                            # Handle different response types
-                            if 'event' in json_data:
-                                if 'completionStart' in json_data['event']:
-                                    debug_print(f"completionStart: {json_data['event']}")
-                                elif 'contentStart' in json_data['event']:
-                                    debug_print("Content start detected")
-                                    content_start = json_data['event']['contentStart']
-                                    # set role
-                                    self.role = content_start['role']
-                                    # Check for speculative content
-                                    if 'additionalModelFields' in content_start:
-                                        try:
-                                            additional_fields = json.loads(content_start['additionalModelFields'])
-                                            if additional_fields.get('generationStage') == 'SPECULATIVE':
-                                                debug_print("Speculative content detected")
-                                                self.display_assistant_text = True
-                                            else:
-                                                self.display_assistant_text = False
-                                        except json.JSONDecodeError:
-                                            debug_print("Error parsing additionalModelFields")
-                                elif 'textOutput' in json_data['event']:
-                                    text_content = json_data['event']['textOutput']['content']
-                                    role = json_data['event']['textOutput']['role']
-                                    # Check if there is a barge-in
-                                    if '{ "interrupted" : true }' in text_content:
-                                        debug_print("Barge-in detected. Stopping audio output.")
-                                        self.barge_in = True
-
-                                    if (self.role == "ASSISTANT" and self.display_assistant_text):
-                                        print(f"Assistant: {text_content}")
-                                        # Send text to WebSocket client
-                                        if self.websocket:
-                                            await self.websocket.send_json({
-                                                "type": "text",
-                                                "role": "assistant",
-                                                "content": text_content
-                                            })
-                                    elif (self.role == "USER"):
-                                        print(f"User: {text_content}")
-                                        # Send text to WebSocket client
-                                        if self.websocket:
-                                            await self.websocket.send_json({
-                                                "type": "text",
-                                                "role": "user",
-                                                "content": text_content
-                                            })
-                                elif 'audioOutput' in json_data['event']:
-                                    audio_content = json_data['event']['audioOutput']['content']
-                                    # Send audio to WebSocket client
-                                    if self.websocket:
-                                        await self.websocket.send_json({
-                                            "type": "audio",
-                                            "content": audio_content
-                                        })
-                                elif 'toolUse' in json_data['event']:
-                                    self.toolUseContent = json_data['event']['toolUse']
-                                    self.toolName = json_data['event']['toolUse']['toolName']
-                                    self.toolUseId = json_data['event']['toolUse']['toolUseId']
-                                    debug_print(f"Tool use detected: {self.toolName}, ID: {self.toolUseId}")
-                                elif 'contentEnd' in json_data['event'] and json_data['event'].get('contentEnd', {}).get('type') == 'TOOL':
-                                    debug_print("Processing tool use and sending result")
-                                     # Start asynchronous tool processing - non-blocking
-                                    self.handle_tool_request(self.toolName, self.toolUseContent, self.toolUseId)
-                                    debug_print("Processing tool use asynchronously")
-                                elif 'contentEnd' in json_data['event']:
-                                    debug_print("Content end")
-                                elif 'completionEnd' in json_data['event']:
-                                    # Handle end of conversation, no more response will be generated
-                                    debug_print("End of response sequence")
-                                elif 'usageEvent' in json_data['event']:
-                                    debug_print(f"UsageEvent: {json_data['event']}")
-                            # Put the response in the output queue for other components
-                            await self.output_queue.put(json_data)
-                        except json.JSONDecodeError:
-                            await self.output_queue.put({"raw_data": response_data})
+                        await self._dispatch_event(result.value.bytes_)
                 except StopAsyncIteration:
                     # Stream has ended
                     break
@@ -1137,16 +789,234 @@ CRITICO: NO uses tools hasta que usuario ACEPTE explicitamente."""
                    # Handle ValidationException properly
                     if "ValidationException" in str(e):
                         error_message = str(e)
-                        print(f"Validation error: {error_message}")
+                        self.log.error("Validation error: %s", error_message)
                     else:
-                        print(f"Error receiving response: {e}")
+                        self.log.error("Error receiving response: %s", e)
                     break
                     
         except Exception as e:
-            print(f"Response processing error: {e}")
+            self.log.error("Response processing error: %s", e)
         finally:
             self.is_active = False
+            # The audio loop stops with the stream; do not leave producers blocked on a full queue
+            self.audio_input_queue.close()
+
+    async def _dispatch_event(self, payload):
+        """Route one raw output event to its handler."""
+        observed = self.event_subscribers or self.event_callbacks
+        event_type = output_events.event_type(payload)
+        
+        # Most events are audio: forward the base64 content without building the dict
+        if not observed and event_type == 'audioOutput':
+            audio_content = output_events.audio_output_content(payload)
+            if audio_content is not None:
+                BEDROCK_EVENTS_RECEIVED.inc(event_type)
+                await self._send_audio_output(audio_content)
+                return
+        
+        try:
+            json_data = output_events.loads(payload)
+        except json.JSONDecodeError:
+            BEDROCK_EVENTS_RECEIVED.inc("invalid")
+            if observed:
+                self._publish_event({"raw_data": payload.decode('utf-8', 'replace')})
+            return
+        
+        event = json_data.get('event')
+        if not event:
+            BEDROCK_EVENTS_RECEIVED.inc("unknown")
+        else:
+            event_type, body = next(iter(event.items()))
+            BEDROCK_EVENTS_RECEIVED.inc(event_type)
+            handler = self.event_handlers.get(event_type)
+            if handler is not None:
+                await handler(body)
+        
+        # Fan the response out to any registered observers
+        if observed:
+            self._publish_event(json_data)
+
+    async def _on_completion_start(self, body):
+        self.log.debug("completionStart: %s", body, extra={"event_type": "completionStart"})
+
+    async def _on_content_start(self, content_start):
+        self.log.debug("Content start detected", extra={"event_type": "contentStart"})
+        # set role
+        self.role = content_start['role']
+        # A new assistant audio block is the response after an interruption, so resume playback
+        if self.barge_in and content_start.get('type') == 'AUDIO' and self.role == 'ASSISTANT':
+            self.log.debug("Resuming audio output after barge-in (%d frames dropped)", self.dropped_audio_frames)
+            self.barge_in = False
+        # Check for speculative content
+        if 'additionalModelFields' in content_start:
+            try:
+                additional_fields = output_events.loads(content_start['additionalModelFields'])
+                if additional_fields.get('generationStage') == 'SPECULATIVE':
+                    self.log.debug("Speculative content detected")
+                    self.display_assistant_text = True
+                else:
+                    self.display_assistant_text = False
+            except json.JSONDecodeError:
+                self.log.debug("Error parsing additionalModelFields")
+
+    async def _on_text_output(self, text_output):
+        text_content = text_output['content']
+        # Check if there is a barge-in
+        if '{ "interrupted" : true }' in text_content:
+            await self._handle_barge_in()
+
+        if (self.role == "ASSISTANT" and self.display_assistant_text):
+            self.log.info("Assistant: %s", text_content, extra={"event_type": "textOutput"})
+            # Send text to WebSocket client
+            if self.client:
+                self.client.send_json({
+                    "type": "text",
+                    "role": "assistant",
+                    "content": text_content
+                }, PRIORITY_TEXT)
+        elif (self.role == "USER"):
+            self.log.info("User: %s", text_content, extra={"event_type": "textOutput"})
+            # Send text to WebSocket client
+            if self.client:
+                self.client.send_json({
+                    "type": "text",
+                    "role": "user",
+                    "content": text_content
+                }, PRIORITY_TEXT)
+
+    async def _on_audio_output(self, audio_output):
+        await self._send_audio_output(audio_output['content'])
+
+    async def _handle_barge_in(self):
+        """Stop the interrupted response: drop its remaining audio and clear client playback."""
+        if self.barge_in:
+            return
+        self.log.info("Barge-in detected. Stopping audio output.", extra={"event_type": "textOutput"})
+        self.barge_in = True
+        if self.client:
+            # Audio still queued for the client belongs to the interrupted response
+            self.client.clear_audio()
+            self.client.send_json({"type": "barge_in"})
+
+    async def _send_audio_output(self, audio_content):
+        """Queue base64 audio (str or bytes) for the WebSocket client."""
+        if self.barge_in:
+            self.dropped_audio_frames += 1
+            return
+        if not self.client:
+            return
+        if self.user_turn_ended_at is not None:
+            RESPONSE_LATENCY_SECONDS.observe(time.perf_counter() - self.user_turn_ended_at)
+            self.user_turn_ended_at = None
+        if self.audio_output == "binary":
+            # Decode once and ship raw PCM behind a small header
+            frame = pack_audio_frame(base64.b64decode(audio_content), self.audio_output_sequence)
+            self.audio_output_sequence += 1
+            self.client.send_audio(frame)
+        else:
+            if isinstance(audio_content, bytes):
+                audio_content = audio_content.decode('ascii')
+            self.client.send_audio({
+                "type": "audio",
+                "content": audio_content
+            })
+
+    async def _on_tool_use(self, tool_use):
+        tool_name = tool_use['toolName']
+        tool_use_id = tool_use['toolUseId']
+        # Several tool uses can be open at once, track each one separately
+        self.tool_uses[tool_use.get('contentId', tool_use_id)] = tool_use
+        self.log.debug("Tool use detected: %s, ID: %s", tool_name, tool_use_id, extra={"event_type": "toolUse"})
+        # Overlap idempotent tools with the rest of the model output;
+        # the result is still sent after the TOOL contentEnd
+        if tool_name.lower() in EAGER_TOOLS:
+            task = asyncio.create_task(self.tool_processor.process_tool_async(tool_name, tool_use, self.prompt_name))
+            task.add_done_callback(self._on_eager_tool_done)
+            self.eager_tool_tasks[tool_use_id] = task
+
+    def _on_eager_tool_done(self, task):
+        # Retrieve the exception so an abandoned task is not reported as never retrieved;
+        # if the tool use completes, _execute_tool_and_send_result reports the error
+        if not task.cancelled() and task.exception() is not None:
+            self.log.debug("Eager tool execution failed: %s", task.exception(), extra={"event_type": "toolUse"})
+
+    def _discard_open_tool_uses(self):
+        """Drop tool uses still waiting for their TOOL contentEnd when the session closes."""
+        # Model output (even a barge-in) can arrive between toolUse and its contentEnd,
+        # so open tool uses are only given up here
+        if self.tool_uses:
+            self.log.debug("Discarding %d tool uses without a TOOL contentEnd", len(self.tool_uses),
+                           extra={"event_type": "toolUse"})
+            self.tool_uses.clear()
+        for task in self.eager_tool_tasks.values():
+            task.cancel()
+        self.eager_tool_tasks.clear()
+
+    async def _on_content_end(self, content_end):
+        if self.role == "USER":
+            # The final user transcript closes the user's turn; the response clock starts here
+            self.user_turn_ended_at = time.perf_counter()
+        if content_end.get('stopReason') == 'INTERRUPTED':
+            await self._handle_barge_in()
+        if content_end.get('type') != 'TOOL':
+            self.log.debug("Content end", extra={"event_type": "contentEnd"})
+            return
+        self.log.debug("Processing tool use and sending result", extra={"event_type": "contentEnd"})
+        tool_use = self._pop_tool_use(content_end.get('contentId'))
+        if tool_use is not None:
+            # Start asynchronous tool processing - non-blocking
+            self.handle_tool_request(tool_use['toolName'], tool_use, tool_use['toolUseId'])
+            self.log.debug("Processing tool use asynchronously")
+        else:
+            self.log.warning("TOOL contentEnd without a matching toolUse", extra={"event_type": "contentEnd"})
+
+    async def _on_completion_end(self, body):
+        # Handle end of conversation, no more response will be generated
+        self.log.debug("End of response sequence", extra={"event_type": "completionEnd"})
+
+    async def _on_usage_event(self, body):
+        self.log.debug("UsageEvent: %s", body, extra={"event_type": "usageEvent"})
 
+    def subscribe(self, maxsize=256):
+        """Register a bounded queue that receives every Bedrock output event."""
+        queue = asyncio.Queue(maxsize=maxsize)
+        self.event_subscribers.append(queue)
+        return queue
+    
+    def add_event_callback(self, callback):
+        """Register a callable invoked with every Bedrock output event."""
+        self.event_callbacks.append(callback)
+        return callback
+    
+    def unsubscribe(self, subscriber):
+        """Remove a queue or callback registered with subscribe/add_event_callback."""
+        if subscriber in self.event_subscribers:
+            self.event_subscribers.remove(subscriber)
+        if subscriber in self.event_callbacks:
+            self.event_callbacks.remove(subscriber)
+    
+    def _publish_event(self, event):
+        """Deliver an output event to all observers without blocking the receive loop."""
+        for queue in self.event_subscribers:
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                # Slow subscribers lose new events rather than stalling the stream
+                self.dropped_subscriber_events += 1
+        for callback in self.event_callbacks:
+            try:
+                callback(event)
+            except Exception as e:
+                self.log.warning("Event callback failed: %s", e)
+
+    def _pop_tool_use(self, content_id):
+        """Take the toolUse closed by a TOOL contentEnd, falling back to the most recent one."""
+        if content_id in self.tool_uses:
+            return self.tool_uses.pop(content_id)
+        if self.tool_uses:
+            return self.tool_uses.pop(next(reversed(self.tool_uses)))
+        return None
+    
     def handle_tool_request(self, tool_name, tool_content, tool_use_id):
         """Handle a tool request asynchronously"""
         # Create a unique content name for this tool response
@@ -1156,66 +1026,98 @@ CRITICO: NO uses tools hasta que usuario ACEPTE explicitamente."""
         task = asyncio.create_task(self._execute_tool_and_send_result(
             tool_name, tool_content, tool_use_id, tool_content_name))
         
-        # Store the task
-        self.pending_tool_tasks[tool_content_name] = task
+        # Store the task; tools run in parallel and each result is sent when it finishes
+        self.pending_tool_tasks[tool_use_id] = task
         
         # Add error handling
         task.add_done_callback(
-            lambda t: self._handle_tool_task_completion(t, tool_content_name))
+            lambda t: self._handle_tool_task_completion(t, tool_use_id))
     
-    def _handle_tool_task_completion(self, task, content_name):
+    def _handle_tool_task_completion(self, task, tool_use_id):
         """Handle the completion of a tool task"""
         # Remove task from pending tasks
-        if content_name in self.pending_tool_tasks:
-            del self.pending_tool_tasks[content_name]
+        if self.pending_tool_tasks.get(tool_use_id) is task:
+            del self.pending_tool_tasks[tool_use_id]
         
         # Handle any exceptions
         if task.done() and not task.cancelled():
             exception = task.exception()
             if exception:
-                debug_print(f"Tool task failed: {str(exception)}")
+                self.log.warning("Tool task failed: %s", exception)
+    
+    async def _send_tool_result_sequence(self, content_name, tool_use_id, tool_result):
+        """Send one tool result as an uninterrupted start/result/end sequence."""
+        async with self.tool_result_lock:
+            await self.send_tool_start_event(content_name, tool_use_id)
+            await self.send_tool_result_event(content_name, tool_result)
+            await self.send_tool_content_end_event(content_name)
     
     async def _execute_tool_and_send_result(self, tool_name, tool_content, tool_use_id, content_name):
         """Execute a tool and send the result"""
+        start_time = time.perf_counter()
         try:
-            debug_print(f"Starting tool execution: {tool_name}")
+            self.log.debug("Starting tool execution: %s", tool_name)
             
-            # Process the tool - this doesn't block the event loop
-            tool_result = await self.tool_processor.process_tool_async(tool_name, tool_content)
+            # Use the eagerly started execution if there is one, otherwise run the tool now
+            eager_task = self.eager_tool_tasks.pop(tool_use_id, None)
+            if eager_task is not None:
+                tool_result = await eager_task
+            else:
+                tool_result = await self.tool_processor.process_tool_async(tool_name, tool_content, self.prompt_name)
             
             # Send the result sequence
-            await self.send_tool_start_event(content_name, tool_use_id)
-            await self.send_tool_result_event(content_name, tool_result)
-            await self.send_tool_content_end_event(content_name)
+            await self._send_tool_result_sequence(content_name, tool_use_id, tool_result)
+            TOOL_LATENCY_SECONDS.observe(time.perf_counter() - start_time, tool_name)
             
-            debug_print(f"Tool execution complete: {tool_name}")
+            self.log.debug("Tool execution complete: %s", tool_name)
         except Exception as e:
-            debug_print(f"Error executing tool {tool_name}: {str(e)}")
+            self.log.error("Error executing tool %s: %s", tool_name, e)
             # Try to send an error response if possible
             try:
                 error_result = {"error": f"Tool execution failed: {str(e)}"}
                 
-                await self.send_tool_start_event(content_name, tool_use_id)
-                await self.send_tool_result_event(content_name, error_result)
-                await self.send_tool_content_end_event(content_name)
+                await self._send_tool_result_sequence(content_name, tool_use_id, error_result)
             except Exception as send_error:
-                debug_print(f"Failed to send error response: {str(send_error)}")
+                self.log.error("Failed to send error response: %s", send_error)
+    
+    def _log_audio_input_stats(self):
+        """Report microphone audio lost to the input queue once per session."""
+        if self.audio_input_stats_logged:
+            return
+        self.audio_input_stats_logged = True
+        stats = self.audio_input_queue.stats()
+        if stats["dropped_frames"]:
+            self.log.warning("Dropped %d microphone frames (%.0f ms) from the input queue, high water %d frames / %.0f ms",
+                             stats["dropped_frames"], stats["dropped_ms"], stats["high_water_mark"], stats["high_water_ms"])
+        else:
+            self.log.debug("Audio input queue high water %d frames / %.0f ms",
+                           stats["high_water_mark"], stats["high_water_ms"])
     
     async def close(self):
         """Close the stream properly."""
+        self._log_audio_input_stats()
+        self._discard_open_tool_uses()
         if not self.is_active:
+            self._release_client()
             return
         
         # Cancel any pending tool tasks
-        for task in self.pending_tool_tasks.values():
+        for task in list(self.pending_tool_tasks.values()):
             task.cancel()
 
         if self.response_task and not self.response_task.done():
             self.response_task.cancel()
 
+        if self.audio_task and not self.audio_task.done():
+            self.audio_task.cancel()
+
+        # Send any audio still held by the coalescer before closing the content
+        await self._send_audio_frame(self.audio_coalescer.flush())
         await self.send_audio_content_end_event()
         await self.send_prompt_end_event()
         await self.send_session_end_event()
 
         if self.stream_response:
             await self.stream_response.input_stream.close()
+        
+        self._release_client()
@@ -0,0 +1,65 @@
+"""
+Microbenchmark for building audioInput events, the per-chunk hot path to Bedrock.
+
+Compares the old path (pretty-printed str template formatted with % and then
+encoded to UTF-8) against AudioEventEncoder (pre-encoded prefix and suffix
+around the base64 bytes). Runs on a single core, so events/s is per core.
+Wrapping the bytes in BidirectionalInputPayloadPart costs the same in both
+paths and is left out.
+
+Usage:
+    python benchmarks/bench_audio_events.py
+"""
+import base64
+import os
+import sys
+import timeit
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from audio_pipeline import AudioEventEncoder
+
+# 64 ms frames after coalescing, and the 4096-sample chunk browsers send
+CHUNK_SAMPLES = (1024, 4096)
+ITERATIONS = 50000
+
+AUDIO_EVENT_TEMPLATE = '''{
+        "event": {
+            "audioInput": {
+            "promptName": "%s",
+            "contentName": "%s",
+            "content": "%s"
+            }
+        }
+    }'''
+
+
+def main():
+    prompt_name = str(uuid.uuid4())
+    content_name = str(uuid.uuid4())
+    encoder = AudioEventEncoder(prompt_name, content_name)
+
+    def template_str(audio_base64):
+        return (AUDIO_EVENT_TEMPLATE % (prompt_name, content_name, audio_base64)).encode('utf-8')
+
+    print(f"{'samples':>8} {'input':>7} {'template (ev/s)':>16} {'encoder (ev/s)':>15} {'speedup':>8}")
+    for samples in CHUNK_SAMPLES:
+        pcm = os.urandom(samples * 2)
+        audio_base64 = base64.b64encode(pcm).decode('utf-8')
+        cases = (
+            # base64 text passed through from JSON clients
+            ("base64", lambda: template_str(audio_base64), lambda: encoder.encode(audio_base64)),
+            # raw PCM from binary clients or the coalescer
+            ("pcm", lambda: template_str(base64.b64encode(pcm).decode('utf-8')), lambda: encoder.encode_pcm(pcm)),
+        )
+        for label, old_fn, new_fn in cases:
+            old = min(timeit.repeat(old_fn, number=ITERATIONS, repeat=5))
+            new = min(timeit.repeat(new_fn, number=ITERATIONS, repeat=5))
+            old_rate = ITERATIONS / old
+            new_rate = ITERATIONS / new
+            print(f"{samples:>8} {label:>7} {old_rate:>16,.0f} {new_rate:>15,.0f} {new_rate / old_rate:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+"""
+Microbenchmark for the per-chunk cost of ingesting base64 audio from JSON clients.
+
+Compares the old path (decode in the WebSocket handler, re-encode before
+building the audioInput event) against the pass-through path that only
+validates the payload.
+
+Usage:
+    python benchmarks/bench_audio_ingest.py
+"""
+import base64
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from audio_pipeline import is_valid_base64
+
+# 4096 samples is what the browser ScriptProcessor sends, 320 samples is a 20 ms chunk
+CHUNK_SAMPLES = (320, 4096)
+ITERATIONS = 20000
+
+
+def decode_reencode(audio_base64):
+    """Previous path: b64decode in server.py, b64encode in _process_audio_input."""
+    audio_bytes = base64.b64decode(audio_base64)
+    return base64.b64encode(audio_bytes).decode('utf-8')
+
+
+def pass_through(audio_base64):
+    """Current path: validate and hand the string through unchanged."""
+    if not is_valid_base64(audio_base64):
+        raise ValueError("invalid base64")
+    return audio_base64
+
+
+def main():
+    print(f"{'samples':>8} {'decode+encode (us)':>20} {'pass-through (us)':>19} {'speedup':>8}")
+    for samples in CHUNK_SAMPLES:
+        audio_base64 = base64.b64encode(os.urandom(samples * 2)).decode('utf-8')
+        old = min(timeit.repeat(lambda: decode_reencode(audio_base64), number=ITERATIONS, repeat=5))
+        new = min(timeit.repeat(lambda: pass_through(audio_base64), number=ITERATIONS, repeat=5))
+        old_us = old / ITERATIONS * 1e6
+        new_us = new / ITERATIONS * 1e6
+        print(f"{samples:>8} {old_us:>20.2f} {new_us:>19.2f} {old_us / new_us:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""
+Startup-latency benchmark for BedrockStreamManager.initialize_stream.
+
+Runs the real initialization sequence against the in-process fake Bedrock
+stream (fake_bedrock.py), so it measures only our own overhead
+(event building, sequencing and task startup) and needs no AWS access.
+
+Usage:
+    python benchmarks/bench_stream_startup.py [--sessions 200] [--max-p99-ms 50]
+
+Exits with status 1 if the p99 startup time exceeds --max-p99-ms.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bedrock_manager import BedrockStreamManager
+from fake_bedrock import FakeBedrockClient
+
+
+async def measure_startup(sessions):
+    client = FakeBedrockClient()
+    timings = []
+    for _ in range(sessions):
+        manager = BedrockStreamManager()
+        manager.bedrock_client = client
+        start = time.perf_counter()
+        await manager.initialize_stream()
+        await manager.send_audio_content_start_event()
+        timings.append((time.perf_counter() - start) * 1000)
+        await manager.close()
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=200, help="number of sessions to start")
+    parser.add_argument("--max-p99-ms", type=float, default=None, help="fail if p99 startup exceeds this")
+    args = parser.parse_args()
+
+    timings = sorted(asyncio.run(measure_startup(args.sessions)))
+    p50 = statistics.median(timings)
+    p99 = timings[min(len(timings) - 1, int(len(timings) * 0.99))]
+    print(f"sessions={len(timings)} mean={statistics.mean(timings):.2f}ms p50={p50:.2f}ms p99={p99:.2f}ms max={timings[-1]:.2f}ms")
+
+    if args.max_p99_ms is not None and p99 > args.max_p99_ms:
+        print(f"FAIL: p99 startup {p99:.2f}ms exceeds {args.max_p99_ms:.2f}ms")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
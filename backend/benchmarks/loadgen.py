@@ -0,0 +1,299 @@
+"""
+Load generator: N concurrent synthetic callers against a running server.
+
+Each caller opens /ws, starts a session and holds a conversation. Like a
+microphone, it streams 16 kHz PCM in real time for the whole session:
+speech-like noise for each utterance, then digital silence while it waits
+for the assistant to answer and finish speaking. Run the server with the
+fake Bedrock (see fake_bedrock.py) to measure only our own capacity:
+
+    BEDROCK_BACKEND=fake REGISTRATION_BACKEND=fake python server.py
+    python benchmarks/loadgen.py --sessions 50 --turns 3
+
+Reports:
+  - response latency: end of the caller's speech to the first assistant audio
+    (includes the turn detection silence, FAKE_BEDROCK_SILENCE_MS on the fake)
+  - transcript latency: final user transcript to the first assistant audio
+  - CPU per session: server CPU seconds per second divided by the average
+    number of active sessions, from /metrics
+  - memory per session: peak resident memory above the idle baseline divided
+    by the peak number of active sessions, from /metrics
+
+Exits with status 1 if the p99 response latency exceeds --max-p99-ms.
+"""
+import argparse
+import asyncio
+import base64
+import json
+import os
+import statistics
+import sys
+import time
+import urllib.parse
+import urllib.request
+
+import websockets
+
+INPUT_SAMPLE_RATE = 16000
+INPUT_BYTES_PER_MS = INPUT_SAMPLE_RATE * 2 // 1000
+
+
+def percentile(sorted_values, fraction):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+def parse_metrics(text):
+    """Return the unlabeled samples of a Prometheus text page as {name: value}."""
+    values = {}
+    for line in text.splitlines():
+        if not line or line.startswith('#') or '{' in line:
+            continue
+        name, _, value = line.partition(' ')
+        try:
+            values[name] = float(value)
+        except ValueError:
+            pass
+    return values
+
+
+def scrape(metrics_url):
+    with urllib.request.urlopen(metrics_url, timeout=5) as response:
+        return parse_metrics(response.read().decode('utf-8'))
+
+
+class LoadStats:
+    def __init__(self):
+        self.setup_ms = []
+        self.response_ms = []
+        self.transcript_ms = []
+        self.completed_sessions = 0
+        self.failed_sessions = 0
+        self.timeouts = 0
+        self.errors = 0
+        self.barge_ins = 0
+
+
+class SyntheticCaller:
+    """One WebSocket client that talks in turns and times the assistant's answers"""
+
+    def __init__(self, args, stats):
+        self.args = args
+        self.stats = stats
+        self.chunk_s = args.chunk_ms / 1000
+        chunk_bytes = args.chunk_ms * INPUT_BYTES_PER_MS
+        # Random bytes are never all zero, so they always count as speech
+        self.speech = os.urandom(chunk_bytes)
+        self.silence = bytes(chunk_bytes)
+        if args.audio_input == "base64":
+            self.speech = json.dumps({"type": "audio", "content": base64.b64encode(self.speech).decode('ascii')})
+            self.silence = json.dumps({"type": "audio", "content": base64.b64encode(self.silence).decode('ascii')})
+
+        self.started = asyncio.Event()
+        self.ended = asyncio.Event()
+        self.first_audio = asyncio.Event()
+        self.speaking = False
+        self.speech_ended_at = None
+        self.transcript_at = None
+        self.first_audio_at = None
+        self.last_audio_at = None
+
+    async def run(self, delay):
+        await asyncio.sleep(delay)
+        try:
+            async with websockets.connect(self.args.url, max_size=None) as websocket:
+                receiver = asyncio.create_task(self._receive(websocket))
+                microphone = None
+                try:
+                    setup_start = time.perf_counter()
+                    await websocket.send(json.dumps({
+                        "type": "start",
+                        "audio_input": self.args.audio_input,
+                        "audio_output": self.args.audio_output
+                    }))
+                    await asyncio.wait_for(self.started.wait(), self.args.turn_timeout)
+                    self.stats.setup_ms.append((time.perf_counter() - setup_start) * 1000)
+
+                    microphone = asyncio.create_task(self._stream_microphone(websocket))
+                    for _ in range(self.args.turns):
+                        await self._turn()
+                    microphone.cancel()
+                    await websocket.send(json.dumps({"type": "end"}))
+                    await asyncio.wait_for(self.ended.wait(), self.args.turn_timeout)
+                finally:
+                    if microphone:
+                        microphone.cancel()
+                    receiver.cancel()
+            self.stats.completed_sessions += 1
+        except Exception as e:
+            print(f"session failed: {e!r}", file=sys.stderr)
+            self.stats.failed_sessions += 1
+
+    async def _turn(self):
+        self.first_audio.clear()
+        self.transcript_at = self.first_audio_at = self.last_audio_at = None
+        self.speaking = True
+        await asyncio.sleep(self.args.utterance_ms / 1000)
+        self.speaking = False
+        try:
+            await asyncio.wait_for(self.first_audio.wait(), self.args.turn_timeout)
+        except asyncio.TimeoutError:
+            self.stats.timeouts += 1
+            return
+        # Wait for the answer to finish so the next utterance is not a barge-in
+        gap = self.args.gap_ms / 1000
+        while time.perf_counter() - self.last_audio_at < gap:
+            await asyncio.sleep(gap / 2)
+        if self.speech_ended_at is not None:
+            self.stats.response_ms.append((self.first_audio_at - self.speech_ended_at) * 1000)
+        if self.transcript_at is not None:
+            self.stats.transcript_ms.append((self.first_audio_at - self.transcript_at) * 1000)
+
+    async def _stream_microphone(self, websocket):
+        """Send one chunk per chunk_ms on a fixed schedule, speech or silence."""
+        next_send = time.perf_counter()
+        was_speaking = False
+        while True:
+            if was_speaking and not self.speaking:
+                self.speech_ended_at = time.perf_counter()
+            was_speaking = self.speaking
+            await websocket.send(self.speech if self.speaking else self.silence)
+            next_send += self.chunk_s
+            await asyncio.sleep(max(0.0, next_send - time.perf_counter()))
+
+    async def _receive(self, websocket):
+        async for message in websocket:
+            now = time.perf_counter()
+            if isinstance(message, bytes):
+                self._on_audio(now)
+                continue
+            data = json.loads(message)
+            message_type = data.get("type")
+            if message_type == "audio":
+                self._on_audio(now)
+            elif message_type == "text" and data.get("role") == "user":
+                self.transcript_at = now
+            elif message_type == "status" and data.get("message") == "Session started":
+                self.started.set()
+            elif message_type == "status" and data.get("message") == "Session ended":
+                self.ended.set()
+            elif message_type == "barge_in":
+                self.stats.barge_ins += 1
+            elif message_type == "error":
+                self.stats.errors += 1
+                print(f"server error: {data.get('message')}", file=sys.stderr)
+
+    def _on_audio(self, now):
+        if self.first_audio_at is None and not self.speaking:
+            self.first_audio_at = now
+            self.first_audio.set()
+        self.last_audio_at = now
+
+
+async def sample_server(metrics_url, interval, samples):
+    """Scrape /metrics until cancelled, appending (time, cpu_seconds, rss_bytes, active_sessions)."""
+    while True:
+        try:
+            values = await asyncio.to_thread(scrape, metrics_url)
+            samples.append((time.perf_counter(),
+                            values.get("process_cpu_seconds_total", 0.0),
+                            values.get("process_resident_memory_bytes", 0.0),
+                            values.get("nova_sonic_active_sessions", 0.0)))
+        except Exception as e:
+            print(f"metrics scrape failed: {e!r}", file=sys.stderr)
+        await asyncio.sleep(interval)
+
+
+async def run_load(args):
+    stats = LoadStats()
+    baseline = None
+    if args.metrics_url:
+        try:
+            baseline = await asyncio.to_thread(scrape, args.metrics_url)
+        except Exception as e:
+            print(f"metrics unavailable, skipping CPU and memory: {e!r}", file=sys.stderr)
+
+    samples = []
+    sampler = None
+    if baseline is not None:
+        sampler = asyncio.create_task(sample_server(args.metrics_url, args.scrape_interval, samples))
+
+    ramp_step = args.ramp_s / args.sessions if args.sessions > 1 else 0
+    callers = [SyntheticCaller(args, stats) for _ in range(args.sessions)]
+    await asyncio.gather(*(caller.run(index * ramp_step) for index, caller in enumerate(callers)))
+
+    if sampler:
+        sampler.cancel()
+    return stats, baseline, samples
+
+
+def report_latency(label, values):
+    if not values:
+        print(f"{label}: no samples")
+        return None
+    values = sorted(values)
+    p99 = percentile(values, 0.99)
+    print(f"{label}: n={len(values)} p50={statistics.median(values):.0f}ms p99={p99:.0f}ms max={values[-1]:.0f}ms")
+    return p99
+
+
+def report_server(baseline, samples):
+    busy = [sample for sample in samples if sample[3] > 0]
+    if baseline is None or len(busy) < 2:
+        print("server: not enough /metrics samples with active sessions")
+        return
+    start, end = busy[0], busy[-1]
+    mean_sessions = statistics.mean(sample[3] for sample in busy)
+    peak_sessions = max(sample[3] for sample in busy)
+    cpu_cores = (end[1] - start[1]) / (end[0] - start[0])
+    baseline_rss = baseline.get("process_resident_memory_bytes", 0.0)
+    peak_rss = max(sample[2] for sample in busy)
+    mib = 1024 * 1024
+    print(f"server cpu: {cpu_cores:.3f} cores with {mean_sessions:.1f} sessions on average, "
+          f"{cpu_cores / mean_sessions * 1000:.1f} millicores per session")
+    print(f"server memory: baseline={baseline_rss / mib:.1f}MiB peak={peak_rss / mib:.1f}MiB "
+          f"with {peak_sessions:.0f} sessions, {(peak_rss - baseline_rss) / peak_sessions / mib:.2f}MiB per session")
+
+
+def default_metrics_url(ws_url):
+    parts = urllib.parse.urlsplit(ws_url)
+    scheme = "https" if parts.scheme == "wss" else "http"
+    return urllib.parse.urlunsplit((scheme, parts.netloc, "/metrics", "", ""))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="ws://localhost:8000/ws", help="server WebSocket endpoint")
+    parser.add_argument("--metrics-url", default=None, help="Prometheus endpoint (default: /metrics on the same host, 'none' to skip)")
+    parser.add_argument("--sessions", type=int, default=20, help="concurrent callers")
+    parser.add_argument("--ramp-s", type=float, default=5, help="spread session starts over this many seconds")
+    parser.add_argument("--turns", type=int, default=3, help="utterances per session")
+    parser.add_argument("--utterance-ms", type=int, default=1500, help="length of each utterance")
+    parser.add_argument("--chunk-ms", type=int, default=64, help="microphone chunk size")
+    parser.add_argument("--gap-ms", type=int, default=500, help="silence from the assistant that ends its answer")
+    parser.add_argument("--turn-timeout", type=float, default=15, help="seconds to wait for a session start or an answer")
+    parser.add_argument("--audio-input", choices=("binary", "base64"), default="binary")
+    parser.add_argument("--audio-output", choices=("binary", "base64"), default="binary")
+    parser.add_argument("--scrape-interval", type=float, default=1, help="seconds between /metrics scrapes")
+    parser.add_argument("--max-p99-ms", type=float, default=None, help="fail if p99 response latency exceeds this")
+    args = parser.parse_args()
+    if args.metrics_url is None:
+        args.metrics_url = default_metrics_url(args.url)
+    elif args.metrics_url == "none":
+        args.metrics_url = None
+
+    stats, baseline, samples = asyncio.run(run_load(args))
+
+    print(f"sessions={args.sessions} completed={stats.completed_sessions} failed={stats.failed_sessions} "
+          f"timeouts={stats.timeouts} errors={stats.errors} barge_ins={stats.barge_ins}")
+    report_latency("session setup", stats.setup_ms)
+    p99 = report_latency("response latency (end of speech -> first audio)", stats.response_ms)
+    report_latency("transcript -> first audio", stats.transcript_ms)
+    report_server(baseline, samples)
+
+    if args.max_p99_ms is not None and (p99 is None or p99 > args.max_p99_ms):
+        print(f"FAIL: p99 response latency exceeds {args.max_p99_ms:.0f}ms")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
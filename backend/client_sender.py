@@ -0,0 +1,208 @@
+import asyncio
+import os
+import time
+from collections import deque
+from app_logging import get_logger
+from metrics import CLIENT_AUDIO_DROPPED, CLIENT_MESSAGES_SENT, CLIENT_SLOW_CONSUMER_DISCONNECTS
+
+# Assistant audio waiting for a slow client; the oldest frames are dropped past this
+CLIENT_AUDIO_QUEUE_MAX = int(os.environ.get('CLIENT_AUDIO_QUEUE_MAX', '200'))
+# Audio older than this is no longer worth playing and is dropped instead of sent
+CLIENT_AUDIO_STALE_MS = int(os.environ.get('CLIENT_AUDIO_STALE_MS', '5000'))
+# Control messages and transcripts are never dropped; a backlog this large means
+# the client cannot keep up even without audio and the connection is closed
+CLIENT_MESSAGE_QUEUE_MAX = int(os.environ.get('CLIENT_MESSAGE_QUEUE_MAX', '256'))
+# A single send blocked this long marks the client as stalled
+CLIENT_SEND_TIMEOUT_S = float(os.environ.get('CLIENT_SEND_TIMEOUT_S', '5'))
+
+# Message priorities, highest first
+PRIORITY_CONTROL = 0  # status, errors, barge_in, pong
+PRIORITY_TEXT = 1     # transcripts
+PRIORITY_AUDIO = 2
+PRIORITY_NAMES = ("control", "text", "audio")
+
+# WebSocket close code used when a slow client is disconnected (try again later)
+SLOW_CONSUMER_CLOSE_CODE = 1013
+
+logger = get_logger("client_sender")
+
+
+class ClientSender:
+    """Per-connection sender task that owns every write to the client WebSocket
+
+    Producers (the WebSocket handler and the Bedrock response loop) enqueue
+    without waiting. The sender writes control messages first, then
+    transcripts, then audio. When the client falls behind, stale and excess
+    audio is dropped; if control traffic still backs up or a send stalls,
+    the client is disconnected and on_disconnect is called.
+    """
+
+    def __init__(self, websocket, on_disconnect=None, audio_max=CLIENT_AUDIO_QUEUE_MAX,
+                 audio_stale_ms=CLIENT_AUDIO_STALE_MS, message_max=CLIENT_MESSAGE_QUEUE_MAX,
+                 send_timeout=CLIENT_SEND_TIMEOUT_S):
+        self.websocket = websocket
+        self.on_disconnect = on_disconnect
+        self.audio_max = audio_max
+        self.audio_stale = audio_stale_ms / 1000
+        self.message_max = message_max
+        self.send_timeout = send_timeout
+
+        # One FIFO per priority; audio entries carry their enqueue time
+        self.queues = (deque(), deque(), deque())
+        self.wakeup = asyncio.Event()
+        self.idle = asyncio.Event()
+        self.idle.set()
+        self.task = None
+        self.close_task = None
+        self.closed = False
+        self.slow_consumer = False
+
+        self.sent = 0
+        self.dropped_stale_audio = 0
+        self.dropped_overflow_audio = 0
+        self.cleared_audio = 0
+
+    def start(self):
+        """Start the sender task on the running event loop."""
+        if self.task is None:
+            self.task = asyncio.create_task(self._run())
+        return self
+
+    def send_json(self, message, priority=PRIORITY_CONTROL):
+        """Queue a JSON message. Returns False if the connection is closed."""
+        return self._enqueue(priority, (False, message))
+
+    def send_audio(self, payload):
+        """Queue an audio message: a JSON dict, or bytes for a binary frame."""
+        if self.closed:
+            return False
+        audio = self.queues[PRIORITY_AUDIO]
+        if len(audio) >= self.audio_max:
+            audio.popleft()
+            self.dropped_overflow_audio += 1
+            CLIENT_AUDIO_DROPPED.inc("overflow")
+        audio.append((time.monotonic(), isinstance(payload, bytes), payload))
+        self._wake()
+        return True
+
+    def clear_audio(self):
+        """Drop all queued audio (barge-in). Returns the number of dropped messages."""
+        audio = self.queues[PRIORITY_AUDIO]
+        count = len(audio)
+        audio.clear()
+        self.cleared_audio += count
+        if count:
+            CLIENT_AUDIO_DROPPED.inc("barge_in", amount=count)
+        return count
+
+    def _enqueue(self, priority, item):
+        if self.closed:
+            return False
+        queue = self.queues[priority]
+        queue.append(item)
+        if len(self.queues[PRIORITY_CONTROL]) + len(self.queues[PRIORITY_TEXT]) > self.message_max:
+            self._give_up("outbound message backlog")
+            return False
+        self._wake()
+        return True
+
+    def _wake(self):
+        self.idle.clear()
+        self.wakeup.set()
+
+    def _next(self):
+        control, text, audio = self.queues
+        if control:
+            return PRIORITY_CONTROL, control.popleft()
+        if text:
+            return PRIORITY_TEXT, text.popleft()
+        now = time.monotonic()
+        while audio:
+            enqueued_at, is_bytes, payload = audio.popleft()
+            if now - enqueued_at <= self.audio_stale:
+                return PRIORITY_AUDIO, (is_bytes, payload)
+            self.dropped_stale_audio += 1
+            CLIENT_AUDIO_DROPPED.inc("stale")
+        return None
+
+    async def _run(self):
+        try:
+            while not self.closed:
+                item = self._next()
+                if item is None:
+                    self.idle.set()
+                    self.wakeup.clear()
+                    await self.wakeup.wait()
+                    continue
+                priority, (is_bytes, payload) = item
+                send = self.websocket.send_bytes(payload) if is_bytes else self.websocket.send_json(payload)
+                try:
+                    await asyncio.wait_for(send, self.send_timeout)
+                except asyncio.TimeoutError:
+                    self._give_up(f"send blocked for more than {self.send_timeout}s")
+                    return
+                self.sent += 1
+                CLIENT_MESSAGES_SENT.inc(PRIORITY_NAMES[priority])
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # The client went away; the WebSocket handler sees the disconnect itself
+            logger.info("Client send failed: %s", e)
+            self.closed = True
+        finally:
+            self.idle.set()
+
+    def _give_up(self, reason):
+        """Disconnect a client that cannot keep up."""
+        if self.closed:
+            return
+        logger.warning("Disconnecting slow client: %s", reason)
+        self.closed = True
+        self.slow_consumer = True
+        CLIENT_SLOW_CONSUMER_DISCONNECTS.inc()
+        for queue in self.queues:
+            queue.clear()
+        self.wakeup.set()
+        self.close_task = asyncio.create_task(self._close_websocket())
+        if self.on_disconnect:
+            self.on_disconnect()
+
+    async def _close_websocket(self):
+        try:
+            await asyncio.wait_for(self.websocket.close(code=SLOW_CONSUMER_CLOSE_CODE), self.send_timeout)
+        except Exception:
+            pass
+
+    async def close(self, timeout=1.0):
+        """Send what is still queued (bounded by timeout) and stop the sender."""
+        if self.task and not self.closed:
+            try:
+                await asyncio.wait_for(self.idle.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        self.closed = True
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except (asyncio.CancelledError, Exception):
+                pass
+            self.task = None
+        if self.close_task:
+            # Bounded by send_timeout in _close_websocket
+            await self.close_task
+            self.close_task = None
+
+    def stats(self):
+        """Return queue depths and counters for monitoring."""
+        control, text, audio = self.queues
+        return {
+            "queued_control": len(control),
+            "queued_text": len(text),
+            "queued_audio": len(audio),
+            "sent": self.sent,
+            "dropped_stale_audio": self.dropped_stale_audio,
+            "dropped_overflow_audio": self.dropped_overflow_audio,
+            "cleared_audio": self.cleared_audio,
+            "slow_consumer": self.slow_consumer
+        }
@@ -0,0 +1,271 @@
+"""In-process stand-in for the Bedrock bidirectional stream, for load tests without AWS.
+
+FakeBedrockClient replaces BedrockRuntimeClient (BEDROCK_BACKEND=fake) and
+answers with the same output events Nova Sonic produces. It detects the end
+of the caller's turn with a silence detector on the audioInput events:
+digital silence (all-zero PCM) after speech. Then it emits the following:
+
+    USER      contentStart TEXT, textOutput (transcript), contentEnd
+    TOOL      contentStart, toolUse, contentEnd type TOOL   (every Nth turn)
+              ... waits for the toolResult sent by the manager ...
+    ASSISTANT contentStart TEXT (SPECULATIVE), textOutput, contentEnd
+    ASSISTANT contentStart AUDIO, audioOutput x N, contentEnd END_TURN
+
+If speech arrives while the assistant is talking, the response stops with
+an interrupted textOutput and a contentEnd with stopReason INTERRUPTED, as
+in a real barge-in.
+
+The fake runs in the server process, so its own work is included in CPU
+measurements. It is kept small: each response's audio events are encoded
+once and input events are inspected without a full JSON parse.
+"""
+import array
+import asyncio
+import base64
+import binascii
+import json
+import math
+import os
+import uuid
+import output_events
+from audio_pipeline import INPUT_BYTES_PER_MS, OUTPUT_SAMPLE_RATE
+from tool_backends import LatencyProfile
+
+# Time from the final user transcript to the assistant's first output, see LatencyProfile.parse()
+FAKE_BEDROCK_RESPONSE_LATENCY = os.environ.get('FAKE_BEDROCK_RESPONSE_LATENCY', 'normal:0.6,0.15')
+# Time from the user transcript to the toolUse on tool turns
+FAKE_BEDROCK_TOOL_LATENCY = os.environ.get('FAKE_BEDROCK_TOOL_LATENCY', 'fixed:0.3')
+# Silence (ms of audio) after speech that ends the caller's turn
+FAKE_BEDROCK_SILENCE_MS = int(os.environ.get('FAKE_BEDROCK_SILENCE_MS', '500'))
+# Length of each spoken response, and how much faster than real time it is streamed
+FAKE_BEDROCK_RESPONSE_AUDIO_MS = int(os.environ.get('FAKE_BEDROCK_RESPONSE_AUDIO_MS', '2000'))
+FAKE_BEDROCK_AUDIO_SPEED = float(os.environ.get('FAKE_BEDROCK_AUDIO_SPEED', '2'))
+# Every Nth turn calls getInfoFromClinic before answering (0 disables tool calls)
+FAKE_BEDROCK_TOOL_EVERY = int(os.environ.get('FAKE_BEDROCK_TOOL_EVERY', '3'))
+
+# Output audio is sent in 40 ms chunks of 24 kHz 16-bit PCM
+OUTPUT_CHUNK_MS = 40
+TOOL_RESULT_TIMEOUT_S = 30
+FAKE_DNI = "12345678"
+
+
+def _tone(duration_ms, frequency=220, amplitude=2000):
+    samples = OUTPUT_SAMPLE_RATE * duration_ms // 1000
+    step = 2 * math.pi * frequency / OUTPUT_SAMPLE_RATE
+    return array.array('h', (int(amplitude * math.sin(step * i)) for i in range(samples))).tobytes()
+
+
+# One chunk of response audio, shared by every response
+OUTPUT_CHUNK_BASE64 = base64.b64encode(_tone(OUTPUT_CHUNK_MS)).decode('ascii')
+
+
+def _encode(event_type, body):
+    return json.dumps({"event": {event_type: body}}).encode('utf-8')
+
+
+class FakeOutputPart:
+    def __init__(self, bytes_):
+        self.bytes_ = bytes_
+
+
+class FakeOutputChunk:
+    def __init__(self, bytes_):
+        self.value = FakeOutputPart(bytes_)
+
+
+class FakeOutputReceiver:
+    def __init__(self, queue):
+        self.queue = queue
+
+    async def receive(self):
+        payload = await self.queue.get()
+        if payload is None:
+            raise StopAsyncIteration
+        return FakeOutputChunk(payload)
+
+
+class FakeInputStream:
+    def __init__(self, stream):
+        self.stream = stream
+
+    async def send(self, event):
+        self.stream.handle_input(event.value.bytes_)
+
+    async def close(self):
+        self.stream.finish()
+
+
+class FakeBidirectionalStream:
+    """One conversation: consumes input events and produces scripted output events"""
+
+    def __init__(self, response_latency, tool_latency, silence_ms=FAKE_BEDROCK_SILENCE_MS,
+                 response_audio_ms=FAKE_BEDROCK_RESPONSE_AUDIO_MS, audio_speed=FAKE_BEDROCK_AUDIO_SPEED,
+                 tool_every=FAKE_BEDROCK_TOOL_EVERY):
+        self.response_latency = response_latency
+        self.tool_latency = tool_latency
+        self.silence_bytes = silence_ms * INPUT_BYTES_PER_MS
+        self.response_chunks = max(1, response_audio_ms // OUTPUT_CHUNK_MS)
+        self.chunk_interval = OUTPUT_CHUNK_MS / 1000 / audio_speed if audio_speed > 0 else 0
+        self.tool_every = tool_every
+
+        self.input_stream = FakeInputStream(self)
+        self.output = asyncio.Queue()
+        self.receiver = FakeOutputReceiver(self.output)
+        self.session_id = str(uuid.uuid4())
+        self.prompt_name = None
+        self.completion_id = None
+        self.closed = False
+
+        # Turn detection state
+        self.speaking = False
+        self.silence = 0
+        self.turns = 0
+        self.response_task = None
+        self.assistant_speaking = False
+        self.tool_result = None
+
+    async def await_output(self):
+        return None, self.receiver
+
+    def handle_input(self, payload):
+        """Inspect one input event; called for every event the manager sends."""
+        if self.closed:
+            return
+        event_type = output_events.event_type(payload)
+        if event_type == 'audioInput':
+            self._on_audio(payload)
+        elif event_type == 'promptStart':
+            self.prompt_name = output_events.loads(payload)['event']['promptStart']['promptName']
+        elif event_type == 'toolResult':
+            if self.tool_result is not None and not self.tool_result.done():
+                self.tool_result.set_result(output_events.loads(payload)['event']['toolResult']['content'])
+        elif event_type == 'sessionEnd':
+            self.finish()
+
+    def _on_audio(self, payload):
+        # audioInput carries its base64 in the same "content" field as audioOutput
+        content = output_events.audio_output_content(payload)
+        if content is None:
+            return
+        try:
+            pcm = base64.b64decode(content)
+        except binascii.Error:
+            return
+        if pcm.count(0) != len(pcm):
+            self.silence = 0
+            if not self.speaking:
+                self.speaking = True
+                if self.assistant_speaking:
+                    self._interrupt()
+            return
+        if self.speaking:
+            self.silence += len(pcm)
+            if self.silence >= self.silence_bytes:
+                self.speaking = False
+                self.silence = 0
+                self.turns += 1
+                # A new turn supersedes a response that has not started speaking yet
+                if self.response_task is not None:
+                    self.response_task.cancel()
+                self.response_task = asyncio.create_task(self._respond(self.turns))
+
+    def _interrupt(self):
+        """Barge-in: stop the response that is being spoken."""
+        if self.response_task is not None:
+            self.response_task.cancel()
+            self.response_task = None
+        self.assistant_speaking = False
+        content_id = str(uuid.uuid4())
+        self._emit('textOutput', {"role": "ASSISTANT", "contentId": content_id,
+                                  "content": '{ "interrupted" : true }'})
+        self._emit('contentEnd', {"contentId": content_id, "type": "AUDIO", "stopReason": "INTERRUPTED"})
+
+    def _emit(self, event_type, body):
+        if not self.closed:
+            body.update(sessionId=self.session_id, promptName=self.prompt_name, completionId=self.completion_id)
+            self.output.put_nowait(_encode(event_type, body))
+
+    def _emit_text(self, role, text, generation_stage):
+        content_id = str(uuid.uuid4())
+        self._emit('contentStart', {
+            "contentId": content_id, "type": "TEXT", "role": role,
+            "additionalModelFields": json.dumps({"generationStage": generation_stage})
+        })
+        self._emit('textOutput', {"contentId": content_id, "role": role, "content": text})
+        self._emit('contentEnd', {"contentId": content_id, "type": "TEXT", "stopReason": "END_TURN"})
+
+    async def _respond(self, turn):
+        if self.completion_id is None:
+            self.completion_id = str(uuid.uuid4())
+            self._emit('completionStart', {})
+        self._emit_text("USER", f"Mensaje de prueba numero {turn}", "FINAL")
+
+        if self.tool_every > 0 and turn % self.tool_every == 0:
+            await self.tool_latency.wait()
+            await self._call_tool()
+
+        await self.response_latency.wait()
+        self._emit_text("ASSISTANT", f"Respuesta de prueba numero {turn}", "SPECULATIVE")
+
+        content_id = str(uuid.uuid4())
+        self._emit('contentStart', {
+            "contentId": content_id, "type": "AUDIO", "role": "ASSISTANT",
+            "audioOutputConfiguration": {"mediaType": "audio/lpcm", "sampleRateHertz": OUTPUT_SAMPLE_RATE,
+                                         "sampleSizeBits": 16, "channelCount": 1}
+        })
+        # Every chunk of this response is the same event
+        audio_event = _encode('audioOutput', {
+            "content": OUTPUT_CHUNK_BASE64, "contentId": content_id, "role": "ASSISTANT",
+            "sessionId": self.session_id, "promptName": self.prompt_name, "completionId": self.completion_id
+        })
+        self.assistant_speaking = True
+        for _ in range(self.response_chunks):
+            if self.closed:
+                return
+            self.output.put_nowait(audio_event)
+            if self.chunk_interval:
+                await asyncio.sleep(self.chunk_interval)
+        self.assistant_speaking = False
+        self.response_task = None
+        self._emit('contentEnd', {"contentId": content_id, "type": "AUDIO", "stopReason": "END_TURN"})
+
+    async def _call_tool(self):
+        content_id = str(uuid.uuid4())
+        tool_use_id = str(uuid.uuid4())
+        self.tool_result = asyncio.get_running_loop().create_future()
+        self._emit('contentStart', {"contentId": content_id, "type": "TOOL", "role": "TOOL"})
+        self._emit('toolUse', {
+            "contentId": content_id, "toolUseId": tool_use_id, "toolName": "getInfoFromClinic",
+            "content": json.dumps({"dni": FAKE_DNI, "user_consent": True})
+        })
+        self._emit('contentEnd', {"contentId": content_id, "type": "TOOL", "stopReason": "TOOL_USE"})
+        try:
+            await asyncio.wait_for(self.tool_result, TOOL_RESULT_TIMEOUT_S)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            self.tool_result = None
+
+    def finish(self):
+        """End the output stream; the manager's receive loop sees StopAsyncIteration."""
+        if self.closed:
+            return
+        self.closed = True
+        if self.response_task is not None:
+            self.response_task.cancel()
+            self.response_task = None
+        self.output.put_nowait(None)
+
+
+class FakeBedrockClient:
+    """Drop-in for BedrockRuntimeClient.invoke_model_with_bidirectional_stream"""
+
+    def __init__(self, response_latency=None, tool_latency=None, **stream_options):
+        self.response_latency = response_latency or LatencyProfile.parse(FAKE_BEDROCK_RESPONSE_LATENCY)
+        self.tool_latency = tool_latency or LatencyProfile.parse(FAKE_BEDROCK_TOOL_LATENCY)
+        self.stream_options = stream_options
+        self.streams_opened = 0
+
+    async def invoke_model_with_bidirectional_stream(self, operation_input):
+        self.streams_opened += 1
+        return FakeBidirectionalStream(self.response_latency, self.tool_latency, **self.stream_options)
@@ -0,0 +1,151 @@
+import asyncio
+import time
+from collections import OrderedDict
+
+class TTLCache:
+    """Bounded read-through cache with TTL, LRU eviction and single-flight loads
+
+    A loader result of None is cached as a negative entry for negative_ttl
+    seconds. Concurrent misses for the same key share one loader call,
+    which keeps running if the caller that started it is cancelled.
+    """
+
+    def __init__(self, maxsize=10000, ttl=300, negative_ttl=30, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.clock = clock
+
+        # key -> (expires_at, value), least recently used first
+        self.entries = OrderedDict()
+        self.inflight = {}
+
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+
+    async def get_or_load(self, key, loader):
+        """Return the cached value for key, calling loader(key) on a miss."""
+        entry = self.entries.get(key)
+        if entry is not None:
+            expires_at, value = entry
+            if expires_at > self.clock():
+                self.entries.move_to_end(key)
+                if value is None:
+                    self.negative_hits += 1
+                else:
+                    self.hits += 1
+                return value
+            del self.entries[key]
+
+        # Another caller is already loading this key, wait for its result
+        task = self.inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+            return await asyncio.shield(task)
+
+        # The cache owns the load, so a caller that is cancelled (barge-in,
+        # disconnect) does not cancel it for the other sessions waiting on it
+        self.misses += 1
+        task = asyncio.ensure_future(self._load(key, loader))
+        self.inflight[key] = task
+        task.add_done_callback(lambda done: self._finish_load(key, done))
+        return await asyncio.shield(task)
+
+    async def _load(self, key, loader):
+        value = await loader(key)
+        self._store(key, value)
+        return value
+
+    def _finish_load(self, key, task):
+        if self.inflight.get(key) is task:
+            del self.inflight[key]
+        # Mark the exception as retrieved in case nobody else is waiting
+        if not task.cancelled():
+            task.exception()
+
+    def _store(self, key, value):
+        ttl = self.negative_ttl if value is None else self.ttl
+        if ttl <= 0:
+            return
+        self.entries[key] = (self.clock() + ttl, value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, key):
+        """Drop a key so the next lookup goes to the loader."""
+        self.entries.pop(key, None)
+
+    def stats(self):
+        """Return cache counters for monitoring."""
+        return {
+            "size": len(self.entries),
+            "hits": self.hits,
+            "negative_hits": self.negative_hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "evictions": self.evictions
+        }
+
+class IdempotencyCache:
+    """Reuses the result of a side-effecting call for duplicates within a time window
+
+    The first call for a key runs; repeats while it is in flight or after it
+    succeeded share its result. Failed calls are forgotten so they can be
+    retried. Suppressed duplicates are counted per label (e.g. tool name).
+    """
+
+    def __init__(self, window=120, clock=time.monotonic):
+        self.window = window
+        self.clock = clock
+        # key -> (expires_at, task), oldest first
+        self.entries = OrderedDict()
+        self.suppressed = {}
+
+    async def run(self, key, label, factory):
+        """Return the shared result for key, calling factory() only for the first call."""
+        self._prune()
+        entry = self.entries.get(key)
+        if entry is not None:
+            task = entry[1]
+            if not task.done() or self._succeeded(task):
+                self.suppressed[label] = self.suppressed.get(label, 0) + 1
+                return await asyncio.shield(task)
+            del self.entries[key]
+
+        # Shielded so a disconnecting caller does not abort a dispatch already under way
+        task = asyncio.ensure_future(factory())
+        task.add_done_callback(self._consume_exception)
+        self.entries[key] = (self.clock() + self.window, task)
+        return await asyncio.shield(task)
+
+    @staticmethod
+    def _consume_exception(task):
+        if not task.cancelled():
+            task.exception()
+
+    @staticmethod
+    def _succeeded(task):
+        if task.cancelled() or task.exception() is not None:
+            return False
+        result = task.result()
+        return not (isinstance(result, dict) and result.get("success") is False)
+
+    def _prune(self):
+        now = self.clock()
+        while self.entries:
+            key, (expires_at, task) = next(iter(self.entries.items()))
+            if expires_at > now or not task.done():
+                break
+            del self.entries[key]
+
+    def stats(self):
+        """Return the number of remembered calls and suppressed duplicates per label."""
+        return {
+            "entries": len(self.entries),
+            "suppressed": dict(self.suppressed)
+        }
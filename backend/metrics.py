@@ -0,0 +1,207 @@
+"""In-process metrics rendered in the Prometheus text exposition format."""
+import bisect
+import math
+import os
+import sys
+import time
+
+# Not available on Windows; process memory is then reported as 0
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# Latency buckets in seconds, from sub-millisecond event handling up to slow tools
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape_label(value)}"' for name, value in zip(names, values)]
+    pairs.extend(f'{name}="{value}"' for name, value in extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    """Monotonic counter, optionally split by labels"""
+
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+
+    def inc(self, *labels, amount=1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def samples(self):
+        for labels, value in sorted(self.values.items()):
+            yield self.name, _format_labels(self.labelnames, labels), value
+
+
+class Gauge:
+    """Value read from a callback at scrape time
+
+    With labelnames, the callback returns {label values tuple: value}.
+    """
+
+    kind = "gauge"
+
+    def __init__(self, name, documentation, callback, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.callback = callback
+        self.labelnames = tuple(labelnames)
+
+    def samples(self):
+        if not self.labelnames:
+            yield self.name, "", self.callback()
+            return
+        for labels, value in sorted(self.callback().items()):
+            yield self.name, _format_labels(self.labelnames, labels), value
+
+
+class CallbackCounter(Gauge):
+    """Monotonic value read from a callback at scrape time"""
+
+    kind = "counter"
+
+
+class Histogram:
+    """Cumulative histogram with fixed buckets, optionally split by labels"""
+
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [per-bucket counts (last one is +Inf), sum, count]
+        self.values = {}
+
+    def observe(self, value, *labels):
+        entry = self.values.get(labels)
+        if entry is None:
+            entry = self.values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        entry[0][bisect.bisect_left(self.buckets, value)] += 1
+        entry[1] += value
+        entry[2] += 1
+
+    def samples(self):
+        for labels, (counts, total, count) in sorted(self.values.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (math.inf,), counts):
+                cumulative += bucket_count
+                yield (f"{self.name}_bucket",
+                       _format_labels(self.labelnames, labels, (("le", _format_value(bound)),)),
+                       cumulative)
+            yield f"{self.name}_sum", _format_labels(self.labelnames, labels), total
+            yield f"{self.name}_count", _format_labels(self.labelnames, labels), count
+
+
+class MetricsRegistry:
+    """Collection of metrics rendered together on /metrics"""
+
+    def __init__(self):
+        self.metrics = {}
+
+    def register(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def gauge(self, name, documentation, callback, labelnames=()):
+        return self.register(Gauge(name, documentation, callback, labelnames))
+
+    def callback_counter(self, name, documentation, callback, labelnames=()):
+        return self.register(CallbackCounter(name, documentation, callback, labelnames))
+
+    def render(self):
+        """Return every metric in the Prometheus text format."""
+        lines = []
+        for metric in self.metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{labels} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+def resident_memory_bytes():
+    """Current resident set size of this process, or the peak where /proc is unavailable."""
+    try:
+        with open("/proc/self/statm", "rb") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        pass
+    if resource is None:
+        return 0
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+registry = MetricsRegistry()
+
+# Standard process metrics; load tests divide them by active sessions to size instances
+PROCESS_CPU_SECONDS = registry.callback_counter(
+    "process_cpu_seconds_total",
+    "User and system CPU time spent by this process",
+    time.process_time)
+PROCESS_RESIDENT_MEMORY_BYTES = registry.gauge(
+    "process_resident_memory_bytes",
+    "Resident memory size of this process",
+    resident_memory_bytes)
+
+SESSION_SETUP_SECONDS = registry.histogram(
+    "nova_sonic_session_setup_seconds",
+    "Time from the client's start message until the session accepts audio",
+    ("pooled",))
+RESPONSE_LATENCY_SECONDS = registry.histogram(
+    "nova_sonic_response_latency_seconds",
+    "Time from the end of the user's turn (final user transcript) to the first assistant audio")
+TOOL_LATENCY_SECONDS = registry.histogram(
+    "nova_sonic_tool_latency_seconds",
+    "Time from starting a tool until its result is sent to Bedrock",
+    ("tool",))
+BEDROCK_EVENTS_RECEIVED = registry.counter(
+    "nova_sonic_bedrock_events_received_total",
+    "Output events received from Bedrock",
+    ("type",))
+BEDROCK_EVENTS_SENT = registry.counter(
+    "nova_sonic_bedrock_events_sent_total",
+    "Input events sent to Bedrock",
+    ("type",))
+AUDIO_INPUT_DROPPED_FRAMES = registry.counter(
+    "nova_sonic_audio_input_dropped_frames_total",
+    "Microphone frames dropped because a session's input queue was full (drop_oldest policy)")
+CLIENT_MESSAGES_SENT = registry.counter(
+    "nova_sonic_client_messages_sent_total",
+    "Messages written to client WebSockets",
+    ("priority",))
+CLIENT_AUDIO_DROPPED = registry.counter(
+    "nova_sonic_client_audio_dropped_total",
+    "Assistant audio messages dropped before reaching the client",
+    ("reason",))
+CLIENT_SLOW_CONSUMER_DISCONNECTS = registry.counter(
+    "nova_sonic_client_slow_consumer_disconnects_total",
+    "Clients disconnected because they could not keep up with outbound traffic")
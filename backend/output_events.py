@@ -0,0 +1,46 @@
+"""Cheap inspection of Bedrock output events before (or instead of) a full JSON parse."""
+import json
+import re
+
+# orjson is used when installed; the standard library is the fallback
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+if orjson is not None:
+    loads = orjson.loads
+else:
+    loads = json.loads  # accepts bytes as well
+
+# Output events are {"event": {"<type>": {...}}}; the type is the first inner key
+EVENT_TYPE_PATTERN = re.compile(rb'\s*\{\s*"event"\s*:\s*\{\s*"(\w+)"')
+
+CONTENT_PATTERN = re.compile(rb'"content"\s*:\s*"')
+
+
+def event_type(payload):
+    """Return the event type of a raw output event, or None if it cannot be found without parsing."""
+    match = EVENT_TYPE_PATTERN.match(payload)
+    if match is None:
+        return None
+    return match.group(1).decode('ascii')
+
+
+def audio_output_content(payload):
+    """Return the base64 content of a raw audioOutput event as bytes.
+
+    Returns None when the value contains escape sequences, in which case
+    the caller should fall back to a full parse.
+    """
+    match = CONTENT_PATTERN.search(payload)
+    if match is None:
+        return None
+    start = match.end()
+    end = payload.find(b'"', start)
+    if end < 0:
+        return None
+    content = payload[start:end]
+    if b'\\' in content:
+        return None
+    return content
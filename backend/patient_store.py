@@ -0,0 +1,127 @@
+import argparse
+import json
+import os
+import random
+
+# Affiliate records loaded once at startup (.json array or .jsonl, one record per line)
+PATIENT_DATA_PATH = os.environ.get(
+    'PATIENT_DATA_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'patients.json')
+)
+
+class PatientStore:
+    """In-memory patient records indexed by DNI, policy number and policy status
+
+    Records are loaded once and never copied on lookup, so callers must treat
+    the returned dicts as read-only.
+    """
+
+    def __init__(self, records=()):
+        self.by_dni = {}
+        self.by_poliza_numero = {}
+        self.by_poliza_estado = {}
+        for record in records:
+            self.add(record)
+
+    @classmethod
+    def from_file(cls, path=PATIENT_DATA_PATH):
+        """Load records from a JSON array or JSONL file."""
+        with open(path, 'r', encoding='utf-8') as f:
+            if path.endswith('.jsonl'):
+                records = [json.loads(line) for line in f if line.strip()]
+            else:
+                records = json.load(f)
+        return cls(records)
+
+    def add(self, record):
+        """Insert or replace a record and update every index."""
+        dni = record['dni']
+        previous = self.by_dni.get(dni)
+        if previous is not None:
+            self._unindex(previous)
+        self.by_dni[dni] = record
+
+        poliza = record.get('poliza') or {}
+        numero = poliza.get('numero')
+        if numero:
+            self.by_poliza_numero[numero] = record
+        estado = poliza.get('estado')
+        if estado:
+            self.by_poliza_estado.setdefault(estado, []).append(record)
+
+    def _unindex(self, record):
+        poliza = record.get('poliza') or {}
+        numero = poliza.get('numero')
+        if numero and self.by_poliza_numero.get(numero) is record:
+            del self.by_poliza_numero[numero]
+        estado = poliza.get('estado')
+        if estado in self.by_poliza_estado:
+            self.by_poliza_estado[estado] = [r for r in self.by_poliza_estado[estado] if r is not record]
+
+    def get(self, dni):
+        """Return the record for a DNI, or None."""
+        return self.by_dni.get(dni)
+
+    def get_by_poliza(self, numero):
+        """Return the record holding a policy number, or None."""
+        return self.by_poliza_numero.get(numero)
+
+    def list_by_estado(self, estado):
+        """Return every record whose policy has the given status."""
+        return self.by_poliza_estado.get(estado, [])
+
+    def __len__(self):
+        return len(self.by_dni)
+
+    def __contains__(self, dni):
+        return dni in self.by_dni
+
+def generate_records(count, seed=0):
+    """Yield synthetic affiliate records for load testing."""
+    rng = random.Random(seed)
+    nombres = ["Maria", "Carlos", "Ana", "Roberto", "Lucia", "Jorge", "Rosa", "Luis"]
+    apellidos = ["Gonzales", "Mendoza", "Flores", "Vega", "Ramirez", "Quispe", "Torres", "Diaz"]
+    clinicas = ["Clinica Ricardo Palma", "Clinica San Felipe", "Clinica Internacional", "Clinica Delgado"]
+    planes = ["Plan Salud Integral", "Plan Salud Total Plus", "Plan Salud Joven", "Plan Salud Senior"]
+    for i in range(count):
+        dni = f"{20000000 + i:08d}"
+        yield {
+            "dni": dni,
+            "nombre": rng.choice(nombres),
+            "apellido": f"{rng.choice(apellidos)} {rng.choice(apellidos)}",
+            "edad": rng.randint(18, 90),
+            "talla": f"{rng.uniform(1.50, 1.90):.2f}m",
+            "peso": f"{rng.randint(45, 110)}kg",
+            "enfermedades": [],
+            "historial_clinico": [
+                {
+                    "fecha": f"2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+                    "clinica": rng.choice(clinicas),
+                    "motivo": "Chequeo preventivo",
+                    "diagnostico": "Sin observaciones"
+                }
+            ],
+            "poliza": {
+                "numero": f"POL-LT-{i:07d}",
+                "tipo": rng.choice(planes),
+                "estado": rng.choice(["Activa", "Activa", "Activa", "Suspendida"]),
+                "cobertura": "Nacional",
+                "vigencia": "2025-12-31"
+            },
+            "rol_familiar": "Titular",
+            "gestores_autorizados": [],
+            "pacientes_a_cargo": [],
+            "solicitudes_pendientes": []
+        }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate synthetic patient records as JSONL for load testing")
+    parser.add_argument("count", type=int, help="number of records to generate")
+    parser.add_argument("output", help="output .jsonl path")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        for record in generate_records(args.count, args.seed):
+            f.write(json.dumps(record, ensure_ascii=False) + '\n')
+    print(f"Wrote {args.count} records to {args.output}")
@@ -0,0 +1,187 @@
+import asyncio
+import datetime
+import os
+import random
+from collections import deque
+import pytz
+from botocore.exceptions import ClientError
+from app_logging import get_logger
+
+logger = get_logger("persistence")
+
+# Pending writes kept in memory before new ones are rejected
+DYNAMODB_WRITE_QUEUE_MAX = int(os.environ.get('DYNAMODB_WRITE_QUEUE_MAX', '1000'))
+# DynamoDB BatchWriteItem accepts at most 25 items per request
+DYNAMODB_WRITE_BATCH_SIZE = int(os.environ.get('DYNAMODB_WRITE_BATCH_SIZE', '25'))
+DYNAMODB_WRITE_MAX_RETRIES = int(os.environ.get('DYNAMODB_WRITE_MAX_RETRIES', '3'))
+DYNAMODB_WRITE_RETRY_BASE_S = float(os.environ.get('DYNAMODB_WRITE_RETRY_BASE_S', '0.1'))
+
+def build_dynamodb_item(user_data):
+    """Convert user data into a DynamoDB item"""
+    item = {
+        'dni': user_data['dni'],
+        'nombre': user_data['nombre'],
+        'apellido': user_data['apellido'],
+        'nombre_completo': f"{user_data['nombre']} {user_data['apellido']}",
+        'edad': user_data['edad'],
+        'talla': user_data['talla'],
+        'peso': user_data['peso'],
+        'enfermedades': user_data.get('enfermedades', []),
+        'historial_clinico': user_data.get('historial_clinico', []),
+        'rol_familiar': user_data.get('rol_familiar', 'Titular'),
+        'gestores_autorizados': user_data.get('gestores_autorizados', []),
+        'pacientes_a_cargo': user_data.get('pacientes_a_cargo', []),
+        'solicitudes_pendientes': user_data.get('solicitudes_pendientes', []),
+        'timestamp': datetime.datetime.now(pytz.UTC).isoformat(),
+        'ultima_actualizacion': datetime.datetime.now(pytz.UTC).isoformat()
+    }
+
+    # Only add poliza fields if they have non-empty values
+    # DynamoDB doesn't allow empty strings in GSI key attributes
+    poliza = user_data.get('poliza', {})
+    for field in ('numero', 'tipo', 'estado', 'cobertura', 'vigencia'):
+        value = poliza.get(field, '')
+        if value:
+            item[f'poliza_{field}'] = value
+
+    return item
+
+class DynamoWriteBehind:
+    """Write-behind queue that persists user records to DynamoDB off the event loop
+
+    Tools submit records and return immediately. A single worker drains the
+    queue in batches through table.batch_writer() in a worker thread, retries
+    failed batches with jittered exponential back-off and reports every
+    outcome on a side channel (counters, recent results and listeners).
+    """
+
+    def __init__(self, get_table, maxsize=DYNAMODB_WRITE_QUEUE_MAX, batch_size=DYNAMODB_WRITE_BATCH_SIZE,
+                 max_retries=DYNAMODB_WRITE_MAX_RETRIES, retry_base=DYNAMODB_WRITE_RETRY_BASE_S):
+        self.get_table = get_table  # coroutine function returning the table or None
+        self.maxsize = maxsize
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.retry_base = retry_base
+
+        # Side channel for write outcomes
+        self.written = 0
+        self.failed = 0
+        self.rejected = 0
+        self.retries = 0
+        self.recent_results = deque(maxlen=100)
+        self.listeners = []
+
+        self.queue = None
+        self.worker_task = None
+
+    def start(self):
+        """Start the background worker on the running event loop."""
+        if self.worker_task is None or self.worker_task.done():
+            if self.queue is None:
+                self.queue = asyncio.Queue(maxsize=self.maxsize)
+            self.worker_task = asyncio.create_task(self._run())
+
+    def submit(self, user_data):
+        """Queue a user record for persistence without waiting. Returns False if the queue is full."""
+        self.start()
+        try:
+            self.queue.put_nowait(build_dynamodb_item(user_data))
+            return True
+        except asyncio.QueueFull:
+            self.rejected += 1
+            self._record(user_data.get('dni'), False, "write queue full")
+            return False
+
+    def add_listener(self, callback):
+        """Register a callable invoked with every write result."""
+        self.listeners.append(callback)
+        return callback
+
+    async def flush(self, timeout=10):
+        """Wait until every queued write has been attempted."""
+        if self.queue is None or self.worker_task is None:
+            return
+        try:
+            await asyncio.wait_for(self.queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning("DynamoDB flush timed out with %d writes pending", self.queue.qsize())
+
+    async def stop(self, timeout=10):
+        """Flush pending writes and stop the worker."""
+        await self.flush(timeout)
+        if self.worker_task:
+            self.worker_task.cancel()
+            self.worker_task = None
+
+    async def _run(self):
+        while True:
+            batch = [await self.queue.get()]
+            while len(batch) < self.batch_size and not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+            try:
+                await self._write_batch(batch)
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    async def _write_batch(self, batch):
+        table = await self.get_table()
+        if table is None:
+            self.failed += len(batch)
+            for item in batch:
+                self._record(item['dni'], False, "DynamoDB not available")
+            return
+
+        for attempt in range(self.max_retries + 1):
+            try:
+                await asyncio.to_thread(self._put_batch, table, batch)
+                self.written += len(batch)
+                for item in batch:
+                    self._record(item['dni'], True)
+                logger.info("%d registro(s) guardado(s) en DynamoDB exitosamente", len(batch))
+                return
+            except Exception as e:
+                if isinstance(e, ClientError):
+                    error = e.response['Error']['Message']
+                else:
+                    error = str(e)
+                if attempt == self.max_retries:
+                    logger.error("Error guardando en DynamoDB: %s", error)
+                    self.failed += len(batch)
+                    for item in batch:
+                        self._record(item['dni'], False, error)
+                    return
+                # Full jitter keeps retrying sessions from hitting DynamoDB in lockstep
+                self.retries += 1
+                await asyncio.sleep(random.uniform(0, self.retry_base * (2 ** attempt)))
+
+    @staticmethod
+    def _put_batch(table, items):
+        # overwrite_by_pkeys de-duplicates repeated DNIs within one batch
+        with table.batch_writer(overwrite_by_pkeys=['dni']) as writer:
+            for item in items:
+                writer.put_item(Item=item)
+
+    def _record(self, dni, success, error=None):
+        result = {
+            "dni": dni,
+            "success": success,
+            "error": error,
+            "timestamp": datetime.datetime.now(pytz.UTC).isoformat()
+        }
+        self.recent_results.append(result)
+        for callback in self.listeners:
+            try:
+                callback(result)
+            except Exception as e:
+                logger.warning("DynamoDB write listener failed: %s", e)
+
+    def stats(self):
+        """Return write-behind counters for monitoring."""
+        return {
+            "pending": self.queue.qsize() if self.queue else 0,
+            "written": self.written,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "retries": self.retries
+        }
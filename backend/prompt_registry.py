@@ -0,0 +1,310 @@
+import datetime
+import json
+import re
+import pytz
+
+LIMA_TZ = pytz.timezone('America/Lima')
+
+# Placeholders are written into the templates as @@name@@ and survive json.dumps unchanged
+SLOT_PATTERN = re.compile(rb'@@(\w+)@@')
+
+def slot(name):
+    return f"@@{name}@@"
+
+# Tools offered to the model. Adding a tool only needs a new entry here (or
+# PromptRegistry.register_tool) plus its handler in ToolProcessor._run_tool.
+DEFAULT_TOOLS = [
+    {
+        "name": "getInfoFromClinic",
+        "description": "Obtiene informacion del usuario desde su clinica afiliada. USA ESTA TOOL SOLO cuando el usuario diga SI, ACEPTO, CLARO, OK o similar al permiso. Si el usuario solo saluda, NO uses esta tool todavia. Parametros: dni (8 digitos) y user_consent DEBE SER true solo si usuario acepto explicitamente.",
+        "input_schema": {
+            "type": "object",
+            "properties": {
+                "dni": {
+                    "type": "string",
+                    "description": "Numero de DNI del usuario (debe ser exactamente 8 digitos numericos)"
+                },
+                "user_consent": {
+                    "type": "boolean",
+                    "description": "Confirmacion explicita del usuario para acceder a su informacion de la clinica afiliada"
+                }
+            },
+            "required": ["dni", "user_consent"]
+        }
+    },
+    {
+        "name": "registerUser",
+        "description": "Registra manualmente los datos basicos de un nuevo usuario en el sistema. Usar solo cuando el usuario NO da permiso para acceder a informacion de su clinica o cuando no se encuentra su DNI en el sistema.",
+        "input_schema": {
+            "type": "object",
+            "properties": {
+                "dni": {
+                    "type": "string",
+                    "description": "Numero de DNI del usuario (8 digitos)"
+                },
+                "nombre": {
+                    "type": "string",
+                    "description": "Nombre del usuario"
+                },
+                "apellido": {
+                    "type": "string",
+                    "description": "Apellido del usuario"
+                },
+                "edad": {
+                    "type": "integer",
+                    "description": "Edad del usuario en anos"
+                },
+                "peso": {
+                    "type": "string",
+                    "description": "Peso del usuario (ejemplo: 70kg)"
+                },
+                "talla": {
+                    "type": "string",
+                    "description": "Talla o altura del usuario (ejemplo: 1.75m)"
+                },
+                "enfermedades": {
+                    "type": "array",
+                    "items": {"type": "string"},
+                    "description": "Lista de enfermedades que tiene el usuario (puede estar vacio si no tiene ninguna)"
+                }
+            },
+            "required": ["dni", "nombre", "apellido", "edad", "peso", "talla", "enfermedades"]
+        }
+    },
+    {
+        "name": "callAmbulance",
+        "description": "EMERGENCIA VITAL: Llama a una ambulancia de inmediato. USA ESTA TOOL SOLO cuando detectes sintomas de emergencia vital como: dolor en el pecho, dificultad para respirar severa, perdida de conciencia, sangrado severo, dolor abdominal intenso con fiebre alta, convulsiones, trauma grave, sintomas de infarto o derrame cerebral. NO usar para urgencias menores.",
+        "input_schema": {
+            "type": "object",
+            "properties": {
+                "sintomas": {
+                    "type": "string",
+                    "description": "Descripcion de los sintomas de emergencia del paciente"
+                },
+                "ubicacion": {
+                    "type": "string",
+                    "description": "Ubicacion actual del paciente (si esta disponible)"
+                }
+            },
+            "required": ["sintomas"]
+        }
+    }
+]
+
+SYSTEM_PROMPT = """Eres RIMI, el asistente virtual de Rimac Seguros, empresa lider en seguros en Peru. Tu objetivo es ayudar a los usuarios a obtener atencion medica rapida y eficiente.
+
+FECHA Y HORA ACTUAL: @@fecha_hora_actual@@ (Zona horaria: America/Lima)
+
+IDIOMA: Hablas UNICAMENTE en ESPANOL en todo momento. Nunca uses ingles.
+
+TRIAGE CLINICO - PRIORIDAD MAXIMA:
+Cuando el usuario mencione sintomas, PRIMERO evalua la gravedad:
+
+EMERGENCIA VITAL (USA callAmbulance INMEDIATAMENTE):
+- Dolor en el pecho o presion en el pecho
+- Dificultad severa para respirar o falta de aire
+- Perdida de conciencia o desmayo
+- Sangrado severo que no se detiene
+- Dolor abdominal intenso con fiebre alta (>39C)
+- Convulsiones
+- Trauma grave (caidas, accidentes)
+- Sintomas de infarto: dolor en brazo izquierdo, mandibula, sudoracion fria
+- Sintomas de derrame cerebral: confusion, dificultad para hablar, paralisis facial
+- Reaccion alergica severa (dificultad para respirar, hinchazon)
+
+URGENCIA MENOR (Analiza y recomienda clinica):
+- Fiebre moderada con otros sintomas
+- Dolor de estomago o gastrico
+- Vomitos o diarrea
+- Dolor de cabeza intenso
+- Lesiones menores
+- Sintomas de infeccion
+
+FLUJO DE CONVERSACION:
+1) Saluda brevemente y presentate como asistente de Rimac Seguros
+2) Solicita permiso para acceder a datos de clinica afiliada para ayudarlos mejor
+3) ESPERA la respuesta del usuario
+4) Si dice SI/ACEPTO/OK/CLARO, pide DNI de 8 digitos y ENTONCES usa getInfoFromClinic con user_consent=true
+5) Si dice NO al permiso: Inicia registro manual preguntando por DNI, nombre, apellido, edad, peso, talla y enfermedades
+6) IMPORTANTE: Una vez que tengas TODOS los datos del registro manual (dni, nombre, apellido, edad, peso, talla, enfermedades), EJECUTA registerUser INMEDIATAMENTE. NO continues la conversacion sin ejecutar la tool primero.
+7) Despues de ejecutar registerUser exitosamente, di: 'Perfecto, [nombre]. Ya tengo tu informacion registrada. En que puedo ayudarte hoy?'
+8) Pregunta especificamente: "Necesitas atencion para ti o para un familiar? Que sintomas o motivo de consulta tienes?"
+9) TRIAGE: Cuando el usuario mencione sintomas, evalua si es emergencia vital o urgencia menor
+10) Si es EMERGENCIA VITAL: USA callAmbulance INMEDIATAMENTE antes de cualquier otra cosa
+11) Si es urgencia menor: Responde "Entiendo. Por tus sintomas, podria ser [diagnostico tentativo]. Analizando tus mejores opciones..." y proporciona guia
+
+GUIA RAPIDA PARA ATENCION EN CLINICA (usala cuando el usuario necesite ir a una clinica):
+- Clinicas disponibles en tu red: [menciona 2-3 cercanas segun su historial]
+- Para atencion de emergencia: Ve directo a emergencias con tu DNI
+- Para consulta programada: Puedes agendar por app, web o llamando al centro de contacto
+- Documentos necesarios: Solo tu DNI
+- Cobertura: Tu plan [tipo de plan] cubre [tipo de cobertura]
+- Tip: Si vas en horario no punta (10am-3pm), la espera es menor
+
+IMPORTANTE:
+- NO leas todos los datos del usuario (historial, enfermedades, etc.) a menos que el lo solicite
+- Se conversacional, breve y directo
+- Los datos son solo para tu contexto interno
+- Enfocate en lo que el usuario necesita AHORA
+- Si dice NO al permiso, ofrece registro manual con registerUser
+
+CRITICO: NO uses tools hasta que usuario ACEPTE explicitamente."""
+
+class CompiledEvent:
+    """A pre-encoded event split around its slots, rendered by splicing in the slot values"""
+
+    def __init__(self, event):
+        encoded = json.dumps(event).encode('utf-8')
+        # re.split alternates literal segments and slot names
+        parts = SLOT_PATTERN.split(encoded)
+        self.segments = parts[0::2]
+        self.slots = [name.decode('ascii') for name in parts[1::2]]
+
+    def render(self, values):
+        """Return the event bytes with every slot replaced by its JSON-escaped value."""
+        if not self.slots:
+            return self.segments[0]
+        out = [self.segments[0]]
+        for name, segment in zip(self.slots, self.segments[1:]):
+            out.append(values[name])
+            out.append(segment)
+        return b''.join(out)
+
+class CompiledPrompt:
+    """Session initialization events (sessionStart through the system prompt) for one configuration version"""
+
+    def __init__(self, version, tools, system_prompt, voice_id):
+        self.version = version
+        self.events = [CompiledEvent(event) for event in self._build_events(tools, system_prompt, voice_id)]
+
+    @staticmethod
+    def _build_events(tools, system_prompt, voice_id):
+        prompt_name = slot("prompt_name")
+        content_name = slot("content_name")
+        return [
+            {
+                "event": {
+                    "sessionStart": {
+                        "inferenceConfiguration": {
+                            "maxTokens": 1024,
+                            "topP": 0.9,
+                            "temperature": 0.7
+                        }
+                    }
+                }
+            },
+            {
+                "event": {
+                    "promptStart": {
+                        "promptName": prompt_name,
+                        "textOutputConfiguration": {
+                            "mediaType": "text/plain"
+                        },
+                        "audioOutputConfiguration": {
+                            "mediaType": "audio/lpcm",
+                            "sampleRateHertz": 24000,
+                            "sampleSizeBits": 16,
+                            "channelCount": 1,
+                            "voiceId": voice_id,
+                            "encoding": "base64",
+                            "audioType": "SPEECH"
+                        },
+                        "toolUseOutputConfiguration": {
+                            "mediaType": "application/json"
+                        },
+                        "toolConfiguration": {
+                            "tools": [
+                                {
+                                    "toolSpec": {
+                                        "name": tool["name"],
+                                        "description": tool["description"],
+                                        "inputSchema": {
+                                            "json": json.dumps(tool["input_schema"])
+                                        }
+                                    }
+                                }
+                                for tool in tools
+                            ]
+                        }
+                    }
+                }
+            },
+            {
+                "event": {
+                    "contentStart": {
+                        "promptName": prompt_name,
+                        "contentName": content_name,
+                        "type": "TEXT",
+                        "role": "SYSTEM",
+                        "interactive": False,
+                        "textInputConfiguration": {
+                            "mediaType": "text/plain"
+                        }
+                    }
+                }
+            },
+            {
+                "event": {
+                    "textInput": {
+                        "promptName": prompt_name,
+                        "contentName": content_name,
+                        "content": system_prompt
+                    }
+                }
+            },
+            {
+                "event": {
+                    "contentEnd": {
+                        "promptName": prompt_name,
+                        "contentName": content_name
+                    }
+                }
+            }
+        ]
+
+    def render(self, prompt_name, content_name, now=None):
+        """Return the initialization events as bytes, ready to send in order."""
+        now = now or datetime.datetime.now(LIMA_TZ)
+        values = {
+            "prompt_name": _escape(prompt_name),
+            "content_name": _escape(content_name),
+            "fecha_hora_actual": _escape(now.strftime('%Y-%m-%d %H:%M:%S'))
+        }
+        return [event.render(values) for event in self.events]
+
+def _escape(value):
+    return json.dumps(value)[1:-1].encode('utf-8')
+
+class PromptRegistry:
+    """Tools and system prompt offered to the model, compiled once per configuration version"""
+
+    def __init__(self, tools=DEFAULT_TOOLS, system_prompt=SYSTEM_PROMPT, voice_id="matthew"):
+        self.tools = list(tools)
+        self.system_prompt = system_prompt
+        self.voice_id = voice_id
+        self.version = 0
+        self._compiled = None
+
+    def register_tool(self, name, description, input_schema):
+        """Add or replace a tool; sessions started afterwards see the new configuration."""
+        self.tools = [tool for tool in self.tools if tool["name"] != name]
+        self.tools.append({"name": name, "description": description, "input_schema": input_schema})
+        self.version += 1
+
+    def set_system_prompt(self, system_prompt):
+        """Replace the system prompt. The current time is available as @@fecha_hora_actual@@."""
+        self.system_prompt = system_prompt
+        self.version += 1
+
+    def compile(self):
+        """Return the compiled events for the current configuration version."""
+        if self._compiled is None or self._compiled.version != self.version:
+            self._compiled = CompiledPrompt(self.version, self.tools, self.system_prompt, self.voice_id)
+        return self._compiled
+
+    def init_events(self, prompt_name, content_name, now=None):
+        """Return the session initialization events for one session."""
+        return self.compile().render(prompt_name, content_name, now)
+
+# Shared by every session in this process
+prompt_registry = PromptRegistry()
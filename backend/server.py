@@ -1,36 +1,126 @@
 import os
 import asyncio
-import base64
+import json
+import logging
+import time
 from typing import Dict
 from contextlib import asynccontextmanager
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 import uvicorn
-from bedrock_manager import BedrockStreamManager
+from bedrock_manager import BedrockStreamManager, client_registry, get_tool_processor
+from stream_pool import StreamPool
+from audio_pipeline import AudioBackpressureError, is_valid_base64
+from client_sender import ClientSender
+import metrics
+from app_logging import get_logger, setup_logging, shutdown_logging
+
+# Application logs are written by a background thread, see app_logging.py
+setup_logging()
+logger = get_logger("server")
+
+# Supported encodings for microphone and assistant audio, negotiated on "start"
+AUDIO_INPUT_FORMATS = ("base64", "binary")
+AUDIO_OUTPUT_FORMATS = ("base64", "binary")
 
 # Store active connections
 active_connections: Dict[str, BedrockStreamManager] = {}
 
+# Pre-warmed Bedrock streams handed to new callers on "start"
+stream_pool = StreamPool(model_id='amazon.nova-sonic-v1:0', region='us-east-1')
+
+# Queue depths are read from the live sessions when /metrics is scraped
+def _outbound_queue_depth():
+    return sum(
+        sum(len(queue) for queue in manager.client.queues)
+        for manager in active_connections.values() if manager.client
+    )
+
+metrics.registry.gauge(
+    "nova_sonic_active_sessions", "Sessions with an open Bedrock stream",
+    lambda: len(active_connections))
+metrics.registry.gauge(
+    "nova_sonic_audio_input_queue_depth", "Microphone frames waiting to be sent to Bedrock, all sessions",
+    lambda: sum(manager.audio_input_queue.qsize() for manager in active_connections.values()))
+metrics.registry.gauge(
+    "nova_sonic_audio_input_queue_high_water_ms", "Most microphone audio (ms) queued at once in any active session",
+    lambda: max((manager.audio_input_queue.high_water_ms for manager in active_connections.values()), default=0))
+metrics.registry.gauge(
+    "nova_sonic_client_outbound_queue_depth", "Messages waiting to be written to clients, all sessions",
+    _outbound_queue_depth)
+metrics.registry.gauge(
+    "nova_sonic_pending_tool_calls", "Tool calls in progress, all sessions",
+    lambda: sum(len(manager.pending_tool_tasks) for manager in active_connections.values()))
+metrics.registry.gauge(
+    "nova_sonic_dynamodb_write_queue_depth", "User records waiting to be written to DynamoDB",
+    lambda: get_tool_processor().writer.stats()["pending"])
+metrics.registry.gauge(
+    "nova_sonic_stream_pool_ready", "Pre-initialized Bedrock streams ready for new callers",
+    lambda: len(stream_pool.ready))
+
+# Counters kept by the shared components, read through their stats() at scrape time
+def _labelled(stats, keys):
+    return {(key,): stats[key] for key in keys}
+
+metrics.registry.callback_counter(
+    "nova_sonic_dynamodb_writes_total", "User records handled by the DynamoDB write-behind queue",
+    lambda: _labelled(get_tool_processor().writer.stats(), ("written", "failed", "rejected")), ("result",))
+metrics.registry.callback_counter(
+    "nova_sonic_dynamodb_write_retries_total", "Retried DynamoDB batch writes",
+    lambda: get_tool_processor().writer.stats()["retries"])
+metrics.registry.callback_counter(
+    "nova_sonic_clinic_cache_requests_total", "Clinic lookups by cache outcome",
+    lambda: _labelled(get_tool_processor().clinic_cache.stats(), ("hits", "negative_hits", "misses", "coalesced")),
+    ("result",))
+metrics.registry.callback_counter(
+    "nova_sonic_clinic_cache_evictions_total", "Clinic cache entries evicted to stay within CLINIC_CACHE_MAX",
+    lambda: get_tool_processor().clinic_cache.stats()["evictions"])
+metrics.registry.gauge(
+    "nova_sonic_clinic_cache_entries", "DNIs currently held in the clinic cache",
+    lambda: get_tool_processor().clinic_cache.stats()["size"])
+metrics.registry.callback_counter(
+    "nova_sonic_tool_duplicates_suppressed_total", "Repeated side-effecting tool calls answered with the first result",
+    lambda: {(tool,): count for tool, count in get_tool_processor().idempotency.stats()["suppressed"].items()},
+    ("tool",))
+metrics.registry.gauge(
+    "nova_sonic_stream_pool_warming", "Bedrock streams being pre-initialized for the pool",
+    lambda: stream_pool.stats()["warming"])
+metrics.registry.callback_counter(
+    "nova_sonic_stream_pool_acquires_total", "Session starts served from the stream pool (hit) or not (miss)",
+    lambda: _labelled(stream_pool.stats(), ("hits", "misses")), ("result",))
+metrics.registry.gauge(
+    "nova_sonic_bedrock_clients", "Shared Bedrock client connections",
+    lambda: sum(entry["clients"] for entry in client_registry.stats().values()))
+metrics.registry.gauge(
+    "nova_sonic_bedrock_active_streams", "Bidirectional streams open on the shared Bedrock clients",
+    lambda: sum(entry["active_streams"] for entry in client_registry.stats().values()))
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
-    print("Nova Sonic WebSocket Server starting...")
-    print("Make sure AWS credentials are configured:")
-    print("  - AWS_ACCESS_KEY_ID")
-    print("  - AWS_SECRET_ACCESS_KEY")
-    print("  - AWS_DEFAULT_REGION (or specify region in code)")
+    logger.info("Nova Sonic WebSocket Server starting...")
+    logger.info("Make sure AWS credentials are configured: AWS_ACCESS_KEY_ID, AWS_SECRET_ACCESS_KEY, AWS_DEFAULT_REGION")
+    # Create the shared tool layer and connect to DynamoDB before any session starts
+    await get_tool_processor().get_table()
+    await stream_pool.start()
     
     yield
     
     # Shutdown
-    print("Server shutting down, closing active connections...")
+    logger.info("Server shutting down, closing active connections...")
+    await stream_pool.stop()
     for stream_manager in active_connections.values():
         try:
             await stream_manager.close()
         except:
             pass
     active_connections.clear()
+    
+    # Flush pending DynamoDB writes before exiting
+    await get_tool_processor().writer.stop()
+    # Write out any queued log records
+    shutdown_logging()
 
 app = FastAPI(title="Nova Sonic WebSocket Server", lifespan=lifespan)
 
@@ -78,64 +168,123 @@ async def health_check():
     """Health check endpoint for load balancers"""
     return {"status": "healthy", "service": "nova-sonic-websocket"}
 
+@app.get("/metrics")
+async def metrics_endpoint():
+    """Prometheus metrics: latencies, event rates and queue depths"""
+    return PlainTextResponse(metrics.registry.render(), media_type="text/plain; version=0.0.4")
+
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
     """
     WebSocket endpoint for audio streaming
     
     Expected message formats from client:
-    - Start session: {"type": "start"}
+    - Start session: {"type": "start", "audio_input": "base64|binary", "audio_output": "base64|binary"}
     - Audio chunk: {"type": "audio", "content": "<base64-encoded-audio>"}
+    - Audio chunk (binary mode): binary frame with raw 16 kHz 16-bit mono PCM
     - End session: {"type": "end"}
     
     Server responses:
     - Audio response: {"type": "audio", "content": "<base64-encoded-audio>"}
+    - Audio response (binary mode): binary frame with an 8-byte header
+      (type u8, version u8, sample rate u16, sequence u32, little-endian)
+      followed by raw 24 kHz 16-bit mono PCM
     - Text transcript: {"type": "text", "role": "user|assistant", "content": "<text>"}
+    - Barge-in: {"type": "barge_in"} (stop playing queued assistant audio)
     - Status: {"type": "status", "message": "<status-message>"}
     - Error: {"type": "error", "message": "<error-message>"}
+    
+    Control messages are sent before transcripts, and transcripts before audio.
+    Clients too slow to keep up lose stale audio first and are then
+    disconnected with close code 1013.
     """
     await websocket.accept()
     
     connection_id = id(websocket)
     stream_manager = None
+    binary_audio_input = False
+    # Every write to the client goes through this sender so a slow client never
+    # blocks the Bedrock stream; if it has to give up on the client, it cancels this handler
+    sender = ClientSender(websocket, on_disconnect=asyncio.current_task().cancel).start()
     
     try:
-        await websocket.send_json({
+        sender.send_json({
             "type": "status",
             "message": "Connected to Nova Sonic server"
         })
         
         while True:
             # Receive message from client
-            message = await websocket.receive_json()
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(message.get("code", 1000))
+            
+            # Binary frames are raw PCM and go straight to the stream manager
+            audio_frame = message.get("bytes")
+            if audio_frame is not None:
+                if stream_manager is None or not binary_audio_input:
+                    sender.send_json({
+                        "type": "error",
+                        "message": "Binary audio requires a session started with audio_input 'binary'"
+                    })
+                    continue
+                await stream_manager.add_audio_chunk(audio_frame)
+                continue
+            
+            message = json.loads(message.get("text") or "{}")
             message_type = message.get("type")
             
             if message_type == "start":
                 # Initialize Bedrock stream
                 if stream_manager is None:
+                    audio_input = message.get("audio_input", "base64")
+                    audio_output = message.get("audio_output", "base64")
+                    if audio_input not in AUDIO_INPUT_FORMATS:
+                        sender.send_json({
+                            "type": "error",
+                            "message": f"Unsupported audio_input: {audio_input}"
+                        })
+                        continue
+                    if audio_output not in AUDIO_OUTPUT_FORMATS:
+                        sender.send_json({
+                            "type": "error",
+                            "message": f"Unsupported audio_output: {audio_output}"
+                        })
+                        continue
                     try:
-                        stream_manager = BedrockStreamManager(
-                            model_id='amazon.nova-sonic-v1:0',
-                            region='us-east-1',
-                            websocket=websocket
-                        )
-                        await stream_manager.initialize_stream()
+                        setup_start = time.perf_counter()
+                        # Prefer a pre-warmed stream, fall back to a fresh one
+                        stream_manager = await stream_pool.acquire(sender, audio_output)
+                        pooled = stream_manager is not None
+                        if stream_manager is None:
+                            stream_manager = BedrockStreamManager(
+                                model_id='amazon.nova-sonic-v1:0',
+                                region='us-east-1',
+                                client=sender,
+                                audio_output=audio_output
+                            )
+                            await stream_manager.initialize_stream()
                         await stream_manager.send_audio_content_start_event()
+                        metrics.SESSION_SETUP_SECONDS.observe(
+                            time.perf_counter() - setup_start, "true" if pooled else "false")
                         
                         active_connections[connection_id] = stream_manager
+                        binary_audio_input = audio_input == "binary"
                         
-                        await websocket.send_json({
+                        sender.send_json({
                             "type": "status",
-                            "message": "Session started"
+                            "message": "Session started",
+                            "audio_input": audio_input,
+                            "audio_output": audio_output
                         })
                     except Exception as e:
-                        await websocket.send_json({
+                        sender.send_json({
                             "type": "error",
                             "message": f"Failed to start session: {str(e)}"
                         })
                         raise
                 else:
-                    await websocket.send_json({
+                    sender.send_json({
                         "type": "status",
                         "message": "Session already active"
                     })
@@ -143,19 +292,26 @@ async def websocket_endpoint(websocket: WebSocket):
             elif message_type == "audio":
                 # Process audio chunk
                 if stream_manager is None:
-                    await websocket.send_json({
+                    sender.send_json({
                         "type": "error",
                         "message": "No active session. Send 'start' first."
                     })
                     continue
                 
-                # Decode base64 audio
+                # Validate base64 audio and pass it through without decoding
                 audio_content = message.get("content", "")
+                if not is_valid_base64(audio_content):
+                    sender.send_json({
+                        "type": "error",
+                        "message": "Failed to process audio: invalid base64 content"
+                    })
+                    continue
                 try:
-                    audio_bytes = base64.b64decode(audio_content)
-                    stream_manager.add_audio_chunk(audio_bytes)
+                    await stream_manager.add_audio_base64(audio_content)
+                except AudioBackpressureError:
+                    raise
                 except Exception as e:
-                    await websocket.send_json({
+                    sender.send_json({
                         "type": "error",
                         "message": f"Failed to process audio: {str(e)}"
                     })
@@ -165,12 +321,12 @@ async def websocket_endpoint(websocket: WebSocket):
                 if stream_manager:
                     try:
                         await stream_manager.close()
-                        await websocket.send_json({
+                        sender.send_json({
                             "type": "status",
                             "message": "Session ended"
                         })
                     except Exception as e:
-                        await websocket.send_json({
+                        sender.send_json({
                             "type": "error",
                             "message": f"Error ending session: {str(e)}"
                         })
@@ -178,33 +334,43 @@ async def websocket_endpoint(websocket: WebSocket):
                         if connection_id in active_connections:
                             del active_connections[connection_id]
                         stream_manager = None
+                        binary_audio_input = False
                 else:
-                    await websocket.send_json({
+                    sender.send_json({
                         "type": "status",
                         "message": "No active session to end"
                     })
             
             elif message_type == "ping":
                 # Simple ping/pong for keepalive
-                await websocket.send_json({"type": "pong"})
+                sender.send_json({"type": "pong"})
             
             else:
-                await websocket.send_json({
+                sender.send_json({
                     "type": "error",
                     "message": f"Unknown message type: {message_type}"
                 })
     
     except WebSocketDisconnect:
-        print(f"Client disconnected: {connection_id}")
+        logger.info("Client disconnected", extra={"connection_id": connection_id})
+    except asyncio.CancelledError:
+        if not sender.slow_consumer:
+            raise
+        logger.warning("Slow client disconnected", extra={"connection_id": connection_id})
+    except AudioBackpressureError as e:
+        # Bedrock is not keeping up with this caller, or its stream has ended; end the session
+        logger.warning("Closing session: %s", e, extra={"connection_id": connection_id})
+        stream_ended = stream_manager is not None and stream_manager.audio_input_queue.closed
+        sender.send_json({
+            "type": "error",
+            "message": "Bedrock stream ended, session closed" if stream_ended else "Audio queue overflow, session closed"
+        })
     except Exception as e:
-        print(f"WebSocket error: {str(e)}")
-        try:
-            await websocket.send_json({
-                "type": "error",
-                "message": f"Server error: {str(e)}"
-            })
-        except:
-            pass
+        logger.error("WebSocket error: %s", e, extra={"connection_id": connection_id})
+        sender.send_json({
+            "type": "error",
+            "message": f"Server error: {str(e)}"
+        })
     finally:
         # Cleanup
         if stream_manager:
@@ -216,6 +382,12 @@ async def websocket_endpoint(websocket: WebSocket):
         if connection_id in active_connections:
             del active_connections[connection_id]
         
+        # Deliver any final status or error before closing
+        await sender.close()
+        sender_stats = sender.stats()
+        dropped_audio = sender_stats["dropped_stale_audio"] + sender_stats["dropped_overflow_audio"]
+        logger.log(logging.INFO if dropped_audio else logging.DEBUG, "Client connection closed",
+                   extra={"connection_id": connection_id, **sender_stats})
         try:
             await websocket.close()
         except:
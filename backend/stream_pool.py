@@ -0,0 +1,158 @@
+import asyncio
+import os
+import time
+from collections import deque
+from app_logging import get_logger
+from bedrock_manager import BedrockStreamManager
+from prompt_registry import prompt_registry
+
+# Number of streams kept initialized through sessionStart, promptStart and the
+# system prompt (0 disables the pool)
+STREAM_POOL_SIZE = int(os.environ.get('STREAM_POOL_SIZE', '0'))
+# Idle streams are recycled well before Bedrock times them out. The system
+# prompt's current date/time is fixed at warm-up, so this is also how stale
+# that timestamp can be when the stream is handed out
+STREAM_POOL_MAX_AGE_S = float(os.environ.get('STREAM_POOL_MAX_AGE_S', '45'))
+# Back-off after a failed warm-up so missing credentials do not spin the loop
+STREAM_POOL_RETRY_DELAY_S = float(os.environ.get('STREAM_POOL_RETRY_DELAY_S', '5'))
+
+logger = get_logger("stream_pool")
+
+
+class StreamPool:
+    """Keeps a set of pre-initialized Bedrock streams ready for new callers"""
+
+    def __init__(self, size=STREAM_POOL_SIZE, max_age=STREAM_POOL_MAX_AGE_S,
+                 model_id='amazon.nova-sonic-v1:0', region='us-east-1'):
+        self.size = size
+        self.max_age = max_age
+        self.model_id = model_id
+        self.region = region
+
+        # (created_at, manager) pairs, oldest first
+        self.ready = deque()
+        self.warming = 0
+        self.hits = 0
+        self.misses = 0
+
+        self._refill_event = None
+        self._maintain_task = None
+        self._warm_tasks = set()
+        self._discard_tasks = set()
+
+    async def start(self):
+        """Start filling the pool in the background."""
+        if self.size <= 0:
+            return
+        self._refill_event = asyncio.Event()
+        self._maintain_task = asyncio.create_task(self._maintain())
+
+    async def stop(self):
+        """Stop refilling and close every idle stream."""
+        if self._maintain_task:
+            self._maintain_task.cancel()
+            self._maintain_task = None
+        warm_tasks = list(self._warm_tasks)
+        for task in warm_tasks:
+            task.cancel()
+        # Cancelled warm-ups close their half-open streams before finishing
+        await asyncio.gather(*warm_tasks, return_exceptions=True)
+        while self.ready:
+            _, manager = self.ready.popleft()
+            await self._discard(manager)
+        # Streams already being discarded in the background
+        await asyncio.gather(*list(self._discard_tasks), return_exceptions=True)
+
+    async def acquire(self, client, audio_output='base64'):
+        """Return a ready stream attached to the client sender, or None if none is available."""
+        while self.ready:
+            created_at, manager = self.ready.popleft()
+            self._request_refill()
+            if self._usable(created_at, manager, time.monotonic()):
+                self.hits += 1
+                return manager.attach(client, audio_output)
+            self._discard_later(manager)
+        if self.size > 0:
+            self.misses += 1
+        return None
+
+    def _request_refill(self):
+        if self._refill_event:
+            self._refill_event.set()
+
+    def _usable(self, created_at, manager, now):
+        # Streams started before the tools or system prompt changed carry the old configuration
+        return (manager.is_active and now - created_at < self.max_age
+                and manager.prompt_version == prompt_registry.version)
+
+    def _expire(self):
+        """Drop streams that are too old, were closed by the service or use an old prompt."""
+        now = time.monotonic()
+        fresh = deque()
+        while self.ready:
+            created_at, manager = self.ready.popleft()
+            if self._usable(created_at, manager, now):
+                fresh.append((created_at, manager))
+            else:
+                logger.debug("Recycling expired pooled stream")
+                self._discard_later(manager)
+        self.ready = fresh
+
+    async def _maintain(self):
+        """Keep the pool topped up and recycle streams before they expire."""
+        while True:
+            self._expire()
+            missing = self.size - len(self.ready) - self.warming
+            for _ in range(missing):
+                task = asyncio.create_task(self._warm_one())
+                self._warm_tasks.add(task)
+                task.add_done_callback(self._warm_tasks.discard)
+
+            # Wake up when a stream is taken, or periodically to expire old ones
+            try:
+                await asyncio.wait_for(self._refill_event.wait(), timeout=max(self.max_age / 4, 1))
+            except asyncio.TimeoutError:
+                pass
+            self._refill_event.clear()
+
+    async def _warm_one(self):
+        """Initialize one stream and add it to the pool."""
+        self.warming += 1
+        manager = None
+        try:
+            manager = BedrockStreamManager(model_id=self.model_id, region=self.region)
+            await manager.initialize_stream()
+            self.ready.append((time.monotonic(), manager))
+        except asyncio.CancelledError:
+            # Do not leak a half-open stream or its lease on the shared client
+            if manager is not None:
+                await self._discard(manager)
+            raise
+        except Exception as e:
+            logger.warning("Failed to pre-warm Bedrock stream: %s", e)
+            await asyncio.sleep(STREAM_POOL_RETRY_DELAY_S)
+        finally:
+            self.warming -= 1
+            self._request_refill()
+
+    def _discard_later(self, manager):
+        """Close a stream in the background, keeping the task so stop() can wait for it."""
+        task = asyncio.create_task(self._discard(manager))
+        self._discard_tasks.add(task)
+        task.add_done_callback(self._discard_tasks.discard)
+
+    async def _discard(self, manager):
+        try:
+            await manager.close()
+        except Exception as e:
+            logger.debug("Error closing pooled stream: %s", e)
+
+    def stats(self):
+        """Return pool counters for monitoring."""
+        return {
+            "size": self.size,
+            "ready": len(self.ready),
+            "warming": self.warming,
+            "hits": self.hits,
+            "misses": self.misses
+        }
@@ -0,0 +1,40 @@
+"""
+AudioIngestQueue overflow policies and shutdown.
+
+Run from backend/:
+    python -m unittest discover -s tests
+"""
+import asyncio
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from audio_pipeline import AudioBackpressureError, AudioIngestQueue
+
+
+class AudioIngestQueueTest(unittest.IsolatedAsyncioTestCase):
+    async def test_drop_oldest_respects_duration_cap(self):
+        queue = AudioIngestQueue(32, "drop_oldest", max_ms=200)
+        for frame in range(10):
+            await queue.put(frame, 64)
+        self.assertEqual([await queue.get() for _ in range(queue.qsize())], [7, 8, 9])
+        self.assertEqual(queue.stats()["dropped_frames"], 7)
+
+    async def test_close_wakes_blocked_producer(self):
+        queue = AudioIngestQueue(1, "block")
+        await queue.put("first")
+        blocked = asyncio.create_task(queue.put("second"))
+        await asyncio.sleep(0)
+        self.assertFalse(blocked.done())
+
+        queue.close()
+        with self.assertRaises(AudioBackpressureError):
+            await asyncio.wait_for(blocked, 1)
+        with self.assertRaises(AudioBackpressureError):
+            await queue.put("third")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,92 @@
+"""
+Tool uses must get a toolResult even when model output arrives between the
+toolUse and its TOOL contentEnd.
+
+Run from backend/:
+    python -m unittest discover -s tests
+"""
+import asyncio
+import json
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bedrock_manager import BedrockStreamManager
+
+
+class RecordingInputStream:
+    def __init__(self):
+        self.events = []
+
+    async def send(self, event):
+        self.events.append(json.loads(event.value.bytes_))
+
+    async def close(self):
+        pass
+
+
+class RecordingStream:
+    def __init__(self):
+        self.input_stream = RecordingInputStream()
+
+
+class RecordingToolProcessor:
+    def __init__(self):
+        self.calls = []
+
+    async def process_tool_async(self, tool_name, tool_content, session_id=None):
+        self.calls.append(tool_name)
+        await asyncio.sleep(0)
+        return {"success": True, "tool": tool_name}
+
+
+def event(event_type, body):
+    return json.dumps({"event": {event_type: body}}).encode('utf-8')
+
+
+class ToolUseSequenceTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.tools = RecordingToolProcessor()
+        self.manager = BedrockStreamManager(tool_processor=self.tools)
+        self.stream = RecordingStream()
+        self.manager.stream_response = self.stream
+        self.manager.is_active = True
+
+    async def asyncTearDown(self):
+        self.manager.is_active = False
+        await self.manager.close()
+
+    async def run_sequence(self, tool_name, between):
+        await self.manager._dispatch_event(event('contentStart', {"type": "TOOL", "role": "TOOL", "contentId": "c1"}))
+        await self.manager._dispatch_event(event('toolUse', {
+            "toolName": tool_name, "toolUseId": "u1", "contentId": "c1",
+            "content": json.dumps({"dni": "12345678", "user_consent": True})
+        }))
+        for payload in between:
+            await self.manager._dispatch_event(payload)
+        await self.manager._dispatch_event(event('contentEnd', {"type": "TOOL", "contentId": "c1"}))
+        await asyncio.gather(*self.manager.pending_tool_tasks.values())
+
+    def tool_results(self):
+        return [json.loads(sent["event"]["toolResult"]["content"])
+                for sent in self.stream.input_stream.events if "toolResult" in sent["event"]]
+
+    async def test_text_content_between_tool_use_and_content_end(self):
+        await self.run_sequence("getInfoFromClinic", [
+            event('contentStart', {"type": "TEXT", "role": "ASSISTANT", "contentId": "c2"})
+        ])
+        self.assertEqual(self.tools.calls, ["getInfoFromClinic"])
+        self.assertEqual(self.tool_results(), [{"success": True, "tool": "getInfoFromClinic"}])
+
+    async def test_barge_in_between_tool_use_and_content_end(self):
+        await self.run_sequence("callAmbulance", [
+            event('textOutput', {"role": "ASSISTANT", "content": '{ "interrupted" : true }'})
+        ])
+        self.assertEqual(self.tools.calls, ["callAmbulance"])
+        self.assertEqual(self.tool_results(), [{"success": True, "tool": "callAmbulance"}])
+
+
+if __name__ == "__main__":
+    unittest.main()
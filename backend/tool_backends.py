@@ -0,0 +1,221 @@
+import abc
+import asyncio
+import json
+import os
+import random
+import urllib.error
+import urllib.request
+
+# Which implementation backs each tool
+CLINIC_BACKEND = os.environ.get('CLINIC_BACKEND', 'fake')                # fake | http
+REGISTRATION_BACKEND = os.environ.get('REGISTRATION_BACKEND', 'dynamodb')  # dynamodb | fake
+AMBULANCE_BACKEND = os.environ.get('AMBULANCE_BACKEND', 'fake')          # fake | http
+
+# Latency profiles for the in-process fakes, see LatencyProfile.parse()
+CLINIC_LATENCY = os.environ.get('CLINIC_LATENCY', 'fixed:2')
+REGISTRATION_LATENCY = os.environ.get('REGISTRATION_LATENCY', 'fixed:1')
+AMBULANCE_LATENCY = os.environ.get('AMBULANCE_LATENCY', 'fixed:1')
+
+# Endpoints for the HTTP adapters
+CLINIC_API_URL = os.environ.get('CLINIC_API_URL', '')
+AMBULANCE_API_URL = os.environ.get('AMBULANCE_API_URL', '')
+TOOL_HTTP_TIMEOUT_S = float(os.environ.get('TOOL_HTTP_TIMEOUT_S', '5'))
+
+class BackendUnavailableError(Exception):
+    """Raised when a tool backend cannot serve requests at all"""
+
+class LatencyProfile:
+    """Simulated backend latency: fixed, normal or replayed from a histogram
+
+    Spec strings accepted by parse():
+      "none"                  no delay
+      "fixed:2"               always 2 s
+      "normal:2,0.5"          normal distribution, mean 2 s, stddev 0.5 s (clamped at 0)
+      "histogram:path.json"   JSON list of samples in seconds, or of
+                              [upper_bound_seconds, count] buckets
+    """
+
+    def __init__(self, kind='fixed', mean=0.0, stddev=0.0, samples=None, buckets=None, rng=None):
+        self.kind = kind
+        self.mean = mean
+        self.stddev = stddev
+        self.samples = samples or []
+        self.buckets = buckets or []
+        self.rng = rng or random.Random()
+        if self.buckets:
+            self.bucket_weights = [count for _, count in self.buckets]
+
+    @classmethod
+    def parse(cls, spec):
+        kind, _, args = spec.strip().partition(':')
+        kind = kind.lower()
+        if kind in ('', 'none'):
+            return cls('fixed', 0.0)
+        if kind == 'fixed':
+            return cls('fixed', float(args))
+        if kind == 'normal':
+            mean, stddev = (float(value) for value in args.split(','))
+            return cls('normal', mean, stddev)
+        if kind == 'histogram':
+            with open(args, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data and isinstance(data[0], (list, tuple)):
+                return cls('histogram', buckets=sorted((float(bound), int(count)) for bound, count in data))
+            return cls('replay', samples=[float(value) for value in data])
+        raise ValueError(f"Unknown latency profile: {spec}")
+
+    def sample(self):
+        """Return one latency value in seconds."""
+        if self.kind == 'normal':
+            return max(0.0, self.rng.gauss(self.mean, self.stddev))
+        if self.kind == 'replay':
+            return self.rng.choice(self.samples)
+        if self.kind == 'histogram':
+            index = self.rng.choices(range(len(self.buckets)), weights=self.bucket_weights)[0]
+            lower = self.buckets[index - 1][0] if index > 0 else 0.0
+            return self.rng.uniform(lower, self.buckets[index][0])
+        return self.mean
+
+    async def wait(self):
+        delay = self.sample()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+class ClinicBackend(abc.ABC):
+    """Looks up affiliate records in the clinic system"""
+
+    @abc.abstractmethod
+    async def lookup(self, dni):
+        """Return the patient record for a DNI, or None if it is unknown."""
+        raise NotImplementedError
+
+class RegistrationBackend(abc.ABC):
+    """Stores manually registered users"""
+
+    @abc.abstractmethod
+    async def register(self, user_data):
+        """Persist a new user. Returns False if the write was not accepted."""
+        raise NotImplementedError
+
+class AmbulanceBackend(abc.ABC):
+    """Dispatches emergency ambulances"""
+
+    @abc.abstractmethod
+    async def dispatch(self, sintomas, ubicacion):
+        """Request an ambulance and return the dispatch details (at least eta_minutes)."""
+        raise NotImplementedError
+
+class FakeClinicBackend(ClinicBackend):
+    """In-process clinic backed by the local PatientStore"""
+
+    def __init__(self, patient_store, latency):
+        self.patient_store = patient_store
+        self.latency = latency
+
+    async def lookup(self, dni):
+        await self.latency.wait()
+        return self.patient_store.get(dni)
+
+class HttpClinicBackend(ClinicBackend):
+    """Clinic API adapter: GET {base_url}/patients/{dni}, 404 means unknown"""
+
+    def __init__(self, base_url, timeout=TOOL_HTTP_TIMEOUT_S):
+        if not base_url:
+            raise BackendUnavailableError("CLINIC_API_URL is not configured")
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+
+    def _get(self, dni):
+        try:
+            with urllib.request.urlopen(f"{self.base_url}/patients/{dni}", timeout=self.timeout) as response:
+                return json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            if e.code == 404:
+                return None
+            raise
+
+    async def lookup(self, dni):
+        return await asyncio.to_thread(self._get, dni)
+
+class DynamoRegistrationBackend(RegistrationBackend):
+    """Registers users through the DynamoDB write-behind queue"""
+
+    def __init__(self, writer, get_table):
+        self.writer = writer
+        self.get_table = get_table
+
+    async def register(self, user_data):
+        if await self.get_table() is None:
+            raise BackendUnavailableError("DynamoDB not available")
+        return self.writer.submit(user_data)
+
+class FakeRegistrationBackend(RegistrationBackend):
+    """In-memory registration with simulated latency, for load tests"""
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.users = {}
+
+    async def register(self, user_data):
+        await self.latency.wait()
+        self.users[user_data['dni']] = user_data
+        return True
+
+class FakeAmbulanceBackend(AmbulanceBackend):
+    """Simulated ambulance dispatch"""
+
+    def __init__(self, latency):
+        self.latency = latency
+
+    async def dispatch(self, sintomas, ubicacion):
+        await self.latency.wait()
+        return {"eta_minutes": "8-12"}
+
+class HttpAmbulanceBackend(AmbulanceBackend):
+    """Dispatch API adapter: POST {"sintomas", "ubicacion"} as JSON to the configured URL"""
+
+    def __init__(self, url, timeout=TOOL_HTTP_TIMEOUT_S):
+        if not url:
+            raise BackendUnavailableError("AMBULANCE_API_URL is not configured")
+        self.url = url
+        self.timeout = timeout
+
+    def _post(self, payload):
+        request = urllib.request.Request(
+            self.url,
+            data=json.dumps(payload).encode('utf-8'),
+            headers={"Content-Type": "application/json"},
+            method="POST"
+        )
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            return json.loads(response.read())
+
+    async def dispatch(self, sintomas, ubicacion):
+        return await asyncio.to_thread(self._post, {"sintomas": sintomas, "ubicacion": ubicacion})
+
+class ToolBackends:
+    """The backend used by each tool"""
+
+    def __init__(self, clinic, registration, ambulance):
+        self.clinic = clinic
+        self.registration = registration
+        self.ambulance = ambulance
+
+def create_tool_backends(patient_store_factory, writer, get_table):
+    """Build the tool backends selected by the *_BACKEND environment variables."""
+    if CLINIC_BACKEND == 'http':
+        clinic = HttpClinicBackend(CLINIC_API_URL)
+    else:
+        clinic = FakeClinicBackend(patient_store_factory(), LatencyProfile.parse(CLINIC_LATENCY))
+
+    if REGISTRATION_BACKEND == 'fake':
+        registration = FakeRegistrationBackend(LatencyProfile.parse(REGISTRATION_LATENCY))
+    else:
+        registration = DynamoRegistrationBackend(writer, get_table)
+
+    if AMBULANCE_BACKEND == 'http':
+        ambulance = HttpAmbulanceBackend(AMBULANCE_API_URL)
+    else:
+        ambulance = FakeAmbulanceBackend(LatencyProfile.parse(AMBULANCE_LATENCY))
+
+    return ToolBackends(clinic, registration, ambulance)